@@ -0,0 +1,145 @@
+"""
+历史记录接口压测：用 SQLite（aiosqlite）代替 MySQL，并发请求 /get/writing/all/，
+对比异步会话与旧的同步会话写法（在 async 接口中直接调用同步查询）的吞吐量、延迟，
+以及压测期间事件循环的最大延迟（事件循环是否被数据库查询阻塞）。
+
+本地 SQLite 没有网络往返，--latency 为每条语句模拟 MySQL 的往返耗时：
+等待发生在执行查询的线程中，同步写法阻塞事件循环，异步写法只阻塞 aiosqlite 的工作线程。
+
+用法：python bench_history.py --requests 400 --concurrency 32 --latency 0.005
+也可以用 --url 指向本地 MySQL（此时不模拟延迟），例如 mysql+pymysql://root:密码@localhost:3306/bench
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rows", type=int, default=20, help="用户的写作历史条数")
+    parser.add_argument("--size", type=int, default=2000, help="每条写作历史的字符数")
+    parser.add_argument("--latency", type=float, default=0.005, help="SQLite 下每条语句模拟的往返耗时（秒）")
+    return parser.parse_args()
+
+
+args = parse_args()
+if not args.url:
+    args.url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+# 必须在导入 main 之前设置，main 导入时即创建引擎和表
+os.environ["DATABASE_URL"] = args.url
+
+import httpx
+from typing import Annotated
+from fastapi import Depends
+from sqlalchemy import event
+
+from database import SessionLocal, async_engine, engine
+
+
+def simulate_latency(target_engine, is_async):
+    """在 SQLite 连接上用进度回调模拟每条语句的网络往返，等待发生在执行查询的线程中"""
+    @event.listens_for(target_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        state = connection_record.info["bench_latency"] = {"pending": False}
+
+        def handler():
+            if state["pending"]:
+                state["pending"] = False
+                time.sleep(args.latency)
+            return 0
+
+        if is_async:
+            dbapi_connection.await_(dbapi_connection.driver_connection.set_progress_handler(handler, 100))
+        else:
+            dbapi_connection.set_progress_handler(handler, 100)
+
+    @event.listens_for(target_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["bench_latency"]["pending"] = True
+
+
+if args.url.startswith("sqlite") and args.latency > 0:
+    simulate_latency(engine, is_async=False)
+    simulate_latency(async_engine.sync_engine, is_async=True)
+
+import main
+import models
+
+
+def seed():
+    with SessionLocal() as db:
+        user = db.query(models.User).filter(models.User.username == "bench").first()
+        if user is None:
+            user = models.User(username="bench", email="bench@example.com", first_name="b", last_name="b",
+                               hashed_password="", is_active=True)
+            db.add(user)
+            db.commit()
+        db.query(models.WritingHistory).filter(models.WritingHistory.user_id == user.id).delete()
+        db.add_all(models.WritingHistory(user_id=user.id, writing_data="x" * args.size) for _ in range(args.rows))
+        db.commit()
+
+
+# 旧写法：async 接口中直接执行同步查询，查询期间事件循环被阻塞
+@main.app.get("/bench/sync/writing/all/")
+async def sync_writing_all(current_user: Annotated[main.schemas.User, Depends(main.get_current_active_user)]):
+    with SessionLocal() as db:
+        rows = db.query(models.WritingHistory).filter(models.WritingHistory.user_id == current_user.id).all()
+        return [main.schemas.WritingHistory.model_validate(row) for row in rows]
+
+
+async def run(client, path, headers):
+    latencies = []
+    loop_lags = []
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+
+    async def probe():
+        # 每5毫秒唤醒一次，实际唤醒时间的延后即事件循环被阻塞的时长
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            loop_lags.append(time.perf_counter() - start - 0.005)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    probe_task.cancel()
+
+    latencies.sort()
+    print(f"{path:<28} 吞吐 {args.requests / elapsed:8.1f} req/s  "
+          f"平均 {statistics.mean(latencies) * 1000:7.1f}ms  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f}ms  "
+          f"事件循环最大延迟 {max(loop_lags) * 1000:6.1f}ms")
+
+
+async def bench():
+    token = main.create_access_token({"sub": "bench"})
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"数据库: {args.url}，并发 {args.concurrency}，请求 {args.requests}，"
+              f"每次返回 {args.rows} 条 x {args.size} 字符，模拟往返 {args.latency * 1000:.0f}ms")
+        for path in ("/bench/sync/writing/all/", "/get/writing/all/"):
+            await run(client, path, headers)  # 预热
+            await run(client, path, headers)
+
+
+if __name__ == "__main__":
+    seed()
+    asyncio.run(bench())
@@ -0,0 +1,103 @@
+"""
+登录压测：用 SQLite 代替 MySQL，并发请求 /token，对比 bcrypt 在专用线程池中计算与
+旧写法（在 async 接口中直接同步计算）的登录吞吐量、延迟，以及压测期间事件循环的最大延迟
+（登录高峰时其他请求是否被阻塞）。
+
+用法：python bench_login.py --requests 64 --concurrency 16 --rounds 12
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt 计算代价")
+    return parser.parse_args()
+
+
+args = parse_args()
+# 必须在导入 main 之前设置，main 导入时即创建引擎、表和哈希配置
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+import httpx
+from typing import Annotated
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+
+import crud
+import main
+import models
+import security
+from database import SessionLocal
+
+
+def seed():
+    with SessionLocal() as db:
+        db.add(models.User(username="bench", email="bench@example.com", first_name="b", last_name="b",
+                           hashed_password=security.get_password_hash("password"), is_active=True))
+        db.commit()
+
+
+# 旧写法：async 接口中直接同步校验密码，计算期间事件循环被阻塞
+@main.app.post("/bench/inline/token")
+async def inline_login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: main.SessionDep):
+    user = await crud.get_user_by_username(db, form_data.username)
+    if not user or not security.verify_password(form_data.password, user.hashed_password):
+        raise HTTPException(status_code=401)
+    return {"access_token": main.create_access_token({"sub": user.username}), "token_type": "bearer"}
+
+
+async def run(client, path):
+    latencies = []
+    loop_lags = []
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post(path, data={"username": "bench", "password": "password"})
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+
+    async def probe():
+        # 每5毫秒唤醒一次，实际唤醒时间的延后即事件循环被阻塞的时长
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            loop_lags.append(time.perf_counter() - start - 0.005)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    probe_task.cancel()
+
+    latencies.sort()
+    print(f"{path:<20} 吞吐 {args.requests / elapsed:7.1f} 次/s  "
+          f"平均 {statistics.mean(latencies) * 1000:7.1f}ms  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f}ms  "
+          f"事件循环最大延迟 {max(loop_lags) * 1000:7.1f}ms")
+
+
+async def bench():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"bcrypt rounds={args.rounds}，哈希线程数 {security.PASSWORD_HASH_WORKERS}，"
+              f"并发 {args.concurrency}，登录 {args.requests} 次")
+        for path in ("/bench/inline/token", "/token"):
+            await run(client, path)
+
+
+if __name__ == "__main__":
+    seed()
+    asyncio.run(bench())
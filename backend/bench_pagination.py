@@ -0,0 +1,142 @@
+"""
+分页压测：在写作历史表中生成大量数据（默认 100 万行），比较不同翻页深度下
+旧写法（OFFSET 分页 + 单独的 COUNT 查询）与键集分页（游标，总数作为标量子查询在同一条语句中得到）的耗时。
+
+默认使用临时 SQLite 数据库；也可以用 --url 指向本地 MySQL，
+例如 mysql+pymysql://root:密码@localhost:3306/bench
+
+用法：python bench_pagination.py --rows 1000000 --users 10 --page-size 20
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="")
+    parser.add_argument("--rows", type=int, default=1000000, help="写作历史总行数")
+    parser.add_argument("--users", type=int, default=10, help="写作历史平均分给的用户数")
+    parser.add_argument("--size", type=int, default=100, help="每条写作历史的字符数")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5, help="每个深度重复次数")
+    return parser.parse_args()
+
+
+args = parse_args()
+if not args.url:
+    args.url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+# 必须在导入 database 之前设置
+os.environ["DATABASE_URL"] = args.url
+
+from sqlalchemy import func, insert, select
+
+import crud
+import models
+from database import AsyncSessionLocal, engine
+
+
+def seed():
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(models.WritingHistory.__table__.delete())
+        connection.execute(models.User.__table__.delete())
+        connection.execute(insert(models.User), [
+            {"id": i + 1, "username": f"bench{i}", "email": f"bench{i}@example.com", "hashed_password": ""}
+            for i in range(args.users)
+        ])
+    base = datetime.datetime(2024, 1, 1)
+    offsets = list(range(args.rows))
+    random.seed(0)
+    random.shuffle(offsets)  # 更新时间与插入顺序无关
+    data = "x" * args.size
+    start = time.perf_counter()
+    batch = 10000
+    for first in range(0, args.rows, batch):
+        rows = [
+            {
+                "user_id": i % args.users + 1,
+                "writing_data": data,
+                "title": f"标题{i}",
+                "data_size": args.size,
+                "paragraph_count": 1,
+                "created_at": base,
+                "updated_at": base + datetime.timedelta(seconds=offsets[i]),
+            }
+            for i in range(first, min(first + batch, args.rows))
+        ]
+        with engine.begin() as connection:
+            connection.execute(insert(models.WritingHistory), rows)
+    print(f"已生成 {args.rows} 行写作历史（{args.users} 个用户），耗时 {time.perf_counter() - start:.1f}s")
+
+
+async def cursor_at(db, user_id, position):
+    """取得翻到 position 时的游标（不计入耗时）"""
+    if position == 0:
+        return None
+    row = (await db.execute(
+        select(models.WritingHistory.updated_at, models.WritingHistory.id)
+        .filter(models.WritingHistory.user_id == user_id)
+        .order_by(models.WritingHistory.updated_at.desc(), models.WritingHistory.id.desc())
+        .offset(position - 1).limit(1)
+    )).one()
+    return (row[0], row[1])
+
+
+async def offset_page(db, user_id, position):
+    """旧写法：OFFSET 分页，再用单独的查询统计总数"""
+    items, _ = await crud.list_writing_histories_page(
+        db, user_id, limit=args.page_size, skip=position, with_total=False
+    )
+    total = await db.scalar(
+        select(func.count()).select_from(models.WritingHistory).filter(models.WritingHistory.user_id == user_id)
+    )
+    return items, total
+
+
+async def keyset_page(db, user_id, after, with_total):
+    return await crud.list_writing_histories_page(
+        db, user_id, limit=args.page_size, after=after, with_total=with_total
+    )
+
+
+async def timed(func, *func_args):
+    timings = []
+    result = None
+    for _ in range(args.repeat):
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            result = await func(db, *func_args)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+async def bench():
+    user_id = 1
+    async with AsyncSessionLocal() as db:
+        user_rows = await db.scalar(
+            select(func.count()).select_from(models.WritingHistory).filter(models.WritingHistory.user_id == user_id)
+        )
+    print(f"数据库: {args.url}，用户 {user_id} 有 {user_rows} 行，每页 {args.page_size} 条，取 {args.repeat} 次的中位数")
+    print(f"{'翻页深度':>10} {'OFFSET+COUNT':>14} {'键集+总数':>14} {'键集(无总数)':>14}")
+    for fraction in (0, 0.01, 0.1, 0.5, 0.9, 0.999):
+        position = int(user_rows * fraction)
+        async with AsyncSessionLocal() as db:
+            after = await cursor_at(db, user_id, position)
+        offset_ms, (offset_items, offset_total) = await timed(offset_page, user_id, position)
+        keyset_ms, (keyset_items, keyset_total) = await timed(keyset_page, user_id, after, True)
+        plain_ms, _ = await timed(keyset_page, user_id, after, False)
+        assert [item.id for item in offset_items] == [item.id for item in keyset_items]
+        assert offset_total == keyset_total, (offset_total, keyset_total)
+        print(f"{position:>10} {offset_ms:>12.2f}ms {keyset_ms:>12.2f}ms {plain_ms:>12.2f}ms")
+
+
+if __name__ == "__main__":
+    seed()
+    asyncio.run(bench())
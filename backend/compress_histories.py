@@ -0,0 +1,84 @@
+"""
+压缩已有数据：把 writing_histories.writing_data 和 chat_histories.chat_data 中达到阈值的未压缩内容改写为压缩格式。
+新写入的数据会自动压缩，此脚本用于处理升级前保存的数据，可以重复运行，已压缩的行会被跳过。
+
+用法：python compress_histories.py [--batch-size 200] [--dry-run]
+"""
+
+import argparse
+import time
+
+from sqlalchemy import Text, type_coerce
+
+import compression
+import models
+from database import SessionLocal
+
+COLUMNS = [
+    (models.WritingHistory.__table__, "writing_data"),
+    (models.ChatHistory.__table__, "chat_data"),
+]
+
+
+def compress_column(db, table, column_name, batch_size, dry_run):
+    column = table.c[column_name]
+    # 按 Text 读取数据库中实际存储的内容，不经过 CompressedText 解压
+    stored_column = type_coerce(column, Text)
+    extra_values = {"updated_at": table.c.updated_at} if "updated_at" in table.c else {}  # 保留原来的更新时间
+    scanned = rewritten = before_bytes = after_bytes = 0
+    elapsed = 0.0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            table.select()
+            .with_only_columns(table.c.id, stored_column)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for row_id, stored in rows:
+            scanned += 1
+            if stored is None or compression.is_compressed(stored):
+                continue
+            value = compression.decompress_text(stored)
+            start = time.perf_counter()
+            encoded = compression.compress_text(value)
+            elapsed += time.perf_counter() - start
+            if not compression.is_compressed(encoded):
+                continue
+            rewritten += 1
+            before_bytes += len(stored.encode("utf-8"))
+            after_bytes += len(encoded)
+            if not dry_run:
+                # 写入解压后的文本，由 CompressedText 压缩
+                db.execute(table.update().where(table.c.id == row_id).values({column_name: value, **extra_values}))
+        if not dry_run:
+            db.commit()
+        last_id = rows[-1][0]
+
+    saved = before_bytes - after_bytes
+    print(f"{table.name}.{column_name}: 扫描 {scanned} 行，{'可压缩' if dry_run else '已压缩'} {rewritten} 行，"
+          f"{before_bytes} -> {after_bytes} 字节（节省 {saved} 字节"
+          f"{f'，{saved / before_bytes:.1%}' if before_bytes else ''}），压缩耗时 {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入数据库")
+    args = parser.parse_args()
+
+    if compression.COMPRESSION_ALGORITHM not in compression.MARKERS:
+        print("COMPRESSION_ALGORITHM 为 none，不压缩")
+        return
+    print(f"压缩算法 {compression.COMPRESSION_ALGORITHM}（级别 {compression.COMPRESSION_LEVEL}），"
+          f"阈值 {compression.COMPRESSION_THRESHOLD} 字节")
+    with SessionLocal() as db:
+        for table, column_name in COLUMNS:
+            compress_column(db, table, column_name, args.batch_size, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import base64
+import os
+import threading
+import time
+import zlib
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 压缩算法：zstd（需要安装 zstandard）或 zlib；未安装 zstandard 时使用 zlib，设为 none 时不压缩新写入的数据
+COMPRESSION_ALGORITHM = os.getenv("COMPRESSION_ALGORITHM", "zstd").lower()
+if COMPRESSION_ALGORITHM == "zstd" and zstandard is None:
+    COMPRESSION_ALGORITHM = "zlib"
+# 不小于该字节数的内容才压缩，小内容压缩收益低
+COMPRESSION_THRESHOLD = int(os.getenv("COMPRESSION_THRESHOLD", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "3" if COMPRESSION_ALGORITHM == "zstd" else "6"))
+
+# 存储格式：压缩后的内容为 标记 + base64，未压缩的内容原样存储；
+# 原文恰好以 $ 开头时加上 $raw$ 标记，避免与压缩标记混淆
+MARKERS = {"zlib": "$zlib$", "zstd": "$zstd$"}
+RAW_MARKER = "$raw$"
+
+_lock = threading.Lock()
+_stats = {
+    "compressed": 0, "stored_plain": 0, "decompressed": 0,
+    "input_bytes": 0, "stored_bytes": 0,
+    "compress_seconds": 0.0, "decompress_seconds": 0.0,
+}
+
+
+def _compress_bytes(algorithm, data):
+    if algorithm == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(data)
+    return zlib.compress(data, COMPRESSION_LEVEL)
+
+
+def _decompress_bytes(algorithm, data):
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise RuntimeError("数据使用 zstd 压缩，请安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def is_compressed(stored):
+    return stored is not None and stored.startswith(tuple(MARKERS.values()))
+
+
+def compress_text(value, threshold=None):
+    """把文本编码为存储格式：达到阈值且压缩后更小时压缩，否则原样存储"""
+    if value is None:
+        return None
+    threshold = COMPRESSION_THRESHOLD if threshold is None else threshold
+    data = value.encode("utf-8")
+    if COMPRESSION_ALGORITHM in MARKERS and len(data) >= threshold:
+        start = time.perf_counter()
+        stored = MARKERS[COMPRESSION_ALGORITHM] + base64.b64encode(
+            _compress_bytes(COMPRESSION_ALGORITHM, data)
+        ).decode("ascii")
+        elapsed = time.perf_counter() - start
+        if len(stored) < len(data):
+            with _lock:
+                _stats["compressed"] += 1
+                _stats["input_bytes"] += len(data)
+                _stats["stored_bytes"] += len(stored)
+                _stats["compress_seconds"] += elapsed
+            return stored
+
+    stored = RAW_MARKER + value if value.startswith("$") else value
+    with _lock:
+        _stats["stored_plain"] += 1
+        _stats["input_bytes"] += len(data)
+        _stats["stored_bytes"] += len(stored.encode("utf-8"))
+    return stored
+
+
+def decompress_text(stored):
+    """把存储格式还原为文本；旧的未压缩数据原样返回"""
+    if stored is None or not stored.startswith("$"):
+        return stored
+    if stored.startswith(RAW_MARKER):
+        return stored[len(RAW_MARKER):]
+    for algorithm, marker in MARKERS.items():
+        if stored.startswith(marker):
+            start = time.perf_counter()
+            value = _decompress_bytes(algorithm, base64.b64decode(stored[len(marker):])).decode("utf-8")
+            with _lock:
+                _stats["decompressed"] += 1
+                _stats["decompress_seconds"] += time.perf_counter() - start
+            return value
+    return stored
+
+
+class CompressedText(TypeDecorator):
+    """透明压缩的文本列：写入时按阈值压缩，读取时解压，对 ORM 和查询结果而言仍是普通字符串。
+    压缩后的内容无法在 SQL 中按内容查询（LIKE 等）"""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats["algorithm"] = COMPRESSION_ALGORITHM
+    stats["threshold"] = COMPRESSION_THRESHOLD
+    stats["ratio"] = round(stats["stored_bytes"] / stats["input_bytes"], 4) if stats["input_bytes"] else None
+    return stats
@@ -1,33 +1,127 @@
-from sqlalchemy.orm import Session
+import json
+
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.exc import StaleDataError
 from datetime import datetime  # 添加datetime导入
 
+import json_patch
 import models, schemas
 
-from security import get_password_hash
-
-
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
-
-
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+from security import hash_password
+from user_cache import user_cache
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.User).filter(models.User.id == user_id))
+    return result.scalars().first()
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).filter(models.User.username == username))
+    return result.scalars().first()
+
+
+async def get_users_by_usernames(db: AsyncSession, usernames):
+    """批量按用户名获取用户，返回 {请求中的用户名: schemas.UserWithID}；先查缓存，未命中的用一条 IN 查询取出，
+    转换为不可变快照后写回缓存。
+
+    MySQL 默认的排序规则比较用户名时不区分大小写，IN ('bob') 也会返回 Bob，
+    因此查询结果按小写与请求中的用户名对应，而不是按数据库中的原样"""
+    users = {}
+    missing = {}
+    for username in dict.fromkeys(usernames):
+        user = user_cache.get(username)
+        if user is not None:
+            users[username] = user
+        else:
+            missing[username] = user_cache.version(username)
+    if missing:
+        requested = {}
+        for username in missing:
+            requested.setdefault(username.lower(), []).append(username)
+        result = await db.execute(select(models.User).filter(models.User.username.in_(missing)))
+        for db_user in result.scalars().all():
+            user = schemas.UserWithID.model_validate(db_user)
+            for username in requested.get(user.username.lower(), []):
+                users[username] = user
+            # 只有请求中的用户名与数据库中完全一致时才取得了查询前的版本号
+            version = missing.get(user.username)
+            if version is not None:
+                user_cache.set(user.username, user, version)
+    return users
+
+
+async def get_users_by_ids(db: AsyncSession, user_ids):
+    """批量按 id 获取用户，返回 {id: schemas.UserWithID}；先查缓存，未命中的用一条 IN 查询取出并写回缓存"""
+    users = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        user = user_cache.get_by_id(user_id)
+        if user is not None:
+            users[user_id] = user
+        else:
+            missing.append(user_id)
+    if missing:
+        # 查询前不知道用户名，用全局的失效计数保证不会把失效前的旧数据写回缓存
+        generation = user_cache.generation()
+        result = await db.execute(select(models.User).filter(models.User.id.in_(missing)))
+        for db_user in result.scalars().all():
+            user = schemas.UserWithID.model_validate(db_user)
+            users[user.id] = user
+            user_cache.set(user.username, user, user_cache.version(user.username), generation)
+    return users
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).filter(models.User.email == email))
+    return result.scalars().first()
+
+
+def keyset_before(model, updated_at, row_id):
+    """按 (updated_at, id) 倒序分页时位于游标之后的行。
+    单独的 updated_at <= 条件使数据库能在 (user_id, updated_at) 索引上直接定位到游标处，
+    只写 OR 条件时 MySQL 和 SQLite 都会从索引开头扫描"""
+    return and_(
+        model.updated_at <= updated_at,
+        or_(model.updated_at < updated_at, model.id < row_id),
+    )
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def fetch_page(db: AsyncSession, query, page_query, with_total: bool = True):
+    """执行分页查询 page_query，返回 (记录列表, 总数)；query 为未分页的查询，用于统计总数。
 
+    总数作为不相关的标量子查询附加在同一条语句中，只执行一次，只走索引统计，
+    不像窗口函数 COUNT(*) OVER () 那样需要先取出全部匹配行；with_total 为 False 时不统计，返回 None。
+    """
+    if not with_total:
+        result = await db.execute(page_query)
+        return result.scalars().all(), None
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+    count_query = select(func.count()).select_from(query.order_by(None).subquery())
+    result = await db.execute(page_query.add_columns(count_query.scalar_subquery()))
+    rows = result.all()
+    if rows:
+        return [row[0] for row in rows], rows[0][1]
+    # 已翻过末尾时没有返回行，单独统计
+    return [], await db.scalar(count_query)
 
 
-def count_users(db: Session):
-    return db.query(models.User).count()
+async def get_users_page(db: AsyncSession, limit: int = 100, skip: int = 0, after_id=None, with_total: bool = True):
+    """按 id 顺序分页获取用户；after_id 为上一页最后一个用户的 id，传入时按键集分页，忽略 skip"""
+    query = select(models.User)
+    page_query = query.order_by(models.User.id).limit(limit)
+    if after_id is not None:
+        page_query = page_query.filter(models.User.id > after_id)
+    else:
+        page_query = page_query.offset(skip)
+    return await fetch_page(db, query, page_query, with_total=with_total)
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await hash_password(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -37,31 +131,33 @@ def create_user(db: Session, user: schemas.UserCreate):
         hashed_password=hashed_password,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def delete_user(db: Session, user_id: int):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def delete_user(db: AsyncSession, user_id: int):
+    db_user = await get_user(db, user_id)
     if db_user:
-        db.delete(db_user)
-        db.commit()
+        await db.delete(db_user)
+        await db.commit()
+        user_cache.invalidate(db_user.username)
         return True
     return False
 
 
-def delete_user_by_username(db: Session, username: str):
-    db_user = get_user_by_username(db, username)
+async def delete_user_by_username(db: AsyncSession, username: str):
+    db_user = await get_user_by_username(db, username)
     if db_user:
-        db.delete(db_user)
-        db.commit()
+        await db.delete(db_user)
+        await db.commit()
+        user_cache.invalidate(username)
         return True
     return False
 
 
-def update_user_by_username(db: Session, username: str, user_update: schemas.UserUpdate):
-    db_user = get_user_by_username(db, username)
+async def update_user_by_username(db: AsyncSession, username: str, user_update: schemas.UserUpdate):
+    db_user = await get_user_by_username(db, username)
     if not db_user:
         return None
     
@@ -69,124 +165,400 @@ def update_user_by_username(db: Session, username: str, user_update: schemas.Use
     
     # 如果更新包含密码，需要对其进行哈希处理
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await hash_password(update_data.pop("password"))
     
     for key, value in update_data.items():
         setattr(db_user, key, value)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    # 用户名可能被修改，新旧用户名的缓存都要失效
+    user_cache.invalidate(username, db_user.username)
+    await db.refresh(db_user)
     return db_user
 
 
-def get_chat_history(db: Session, user_id: int):
-    return db.query(models.ChatHistory).filter(models.ChatHistory.user_id == user_id).first()
+async def update_password_hash(db: AsyncSession, db_user: models.User, hashed_password: str):
+    """登录时按新的计算代价重新哈希密码后保存"""
+    db_user.hashed_password = hashed_password
+    await db.commit()
+    user_cache.invalidate(db_user.username)
+    return db_user
+
+
+async def get_chat_history(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.ChatHistory).filter(models.ChatHistory.user_id == user_id))
+    return result.scalars().first()
 
 
-def create_chat_history(db: Session, user_id: int, chat_data: str):
+async def create_chat_history(db: AsyncSession, user_id: int, chat_data: str):
     db_chat_history = models.ChatHistory(user_id=user_id, chat_data=chat_data)
     db.add(db_chat_history)
-    db.commit()
-    db.refresh(db_chat_history)
+    await db.commit()
+    await db.refresh(db_chat_history)
     return db_chat_history
 
 
-def update_chat_history(db: Session, user_id: int, chat_data: str):
-    db_chat_history = get_chat_history(db, user_id)
+async def update_chat_history(db: AsyncSession, user_id: int, chat_data: str):
+    db_chat_history = await get_chat_history(db, user_id)
     if db_chat_history:
         db_chat_history.chat_data = chat_data
         # 删除了 updated_at 时间戳更新
-        db.commit()
-        db.refresh(db_chat_history)
+        await db.commit()
+        await db.refresh(db_chat_history)
         return db_chat_history
     return None
 
 
-def delete_chat_history(db: Session, user_id: int):
-    db_chat_history = get_chat_history(db, user_id)
+async def delete_chat_history(db: AsyncSession, user_id: int):
+    db_chat_history = await get_chat_history(db, user_id)
     if db_chat_history:
-        db.delete(db_chat_history)
-        db.commit()
+        await db.delete(db_chat_history)
+        await db.commit()
         return True
     return False
 
 
-def get_writing_history(db: Session, user_id: int):
-    return db.query(models.WritingHistory).filter(models.WritingHistory.user_id == user_id).first()
+def parse_chat_data(chat_data: str):
+    """解析旧格式的整段聊天记录（JSON 数组），返回 [(role, content)]"""
+    try:
+        items = json.loads(chat_data or "[]")
+    except ValueError:
+        return []
+    if not isinstance(items, list):
+        return []
+    return [
+        (str(item.get("role", "")), str(item.get("content", "")))
+        for item in items if isinstance(item, dict)
+    ]
+
+
+async def get_last_chat_seq(db: AsyncSession, user_id: int, conversation_id: int = 0):
+    last_seq = await db.scalar(select(func.max(models.ChatMessage.seq)).filter(
+        models.ChatMessage.user_id == user_id,
+        models.ChatMessage.conversation_id == conversation_id
+    ))
+    return last_seq or 0
+
+
+async def count_chat_messages(db: AsyncSession, user_id: int, conversation_id: int):
+    return await db.scalar(select(func.count()).select_from(models.ChatMessage).filter(
+        models.ChatMessage.user_id == user_id,
+        models.ChatMessage.conversation_id == conversation_id
+    ))
+
+
+async def get_conversation(db: AsyncSession, user_id: int, conversation_id: int):
+    result = await db.execute(select(models.Conversation).filter(
+        models.Conversation.id == conversation_id,
+        models.Conversation.user_id == user_id
+    ))
+    return result.scalars().first()
+
+
+async def create_conversation(db: AsyncSession, user_id: int, title: str = ""):
+    db_conversation = models.Conversation(user_id=user_id, title=title, message_count=0)
+    db.add(db_conversation)
+    await db.commit()
+    await db.refresh(db_conversation)
+    return db_conversation
+
+
+async def get_default_conversation(db: AsyncSession, user_id: int, create: bool = True):
+    """默认会话（旧接口和 conversation_id=0 使用）：用户最早创建的会话。
+    没有时 create 为 True 则创建，否则返回 None；读取接口传入 create=False，不写数据库"""
+    result = await db.execute(
+        select(models.Conversation).filter(models.Conversation.user_id == user_id)
+        .order_by(models.Conversation.id).limit(1)
+    )
+    db_conversation = result.scalars().first()
+    if db_conversation is None and create:
+        db_conversation = await create_conversation(db, user_id, "默认对话")
+    return db_conversation
+
+
+async def resolve_conversation(db: AsyncSession, user_id: int, conversation_id: int, create: bool = True):
+    """conversation_id 为0时返回默认会话（create 含义同 get_default_conversation），否则返回属于该用户的会话或 None"""
+    if conversation_id == 0:
+        return await get_default_conversation(db, user_id, create=create)
+    return await get_conversation(db, user_id, conversation_id)
+
+
+async def list_conversations(db: AsyncSession, user_id: int, limit: int = 20, after=None):
+    """按最近更新时间倒序列出会话；after 为上一页最后一个会话的 (updated_at, id)，按键集分页"""
+    query = select(models.Conversation).filter(models.Conversation.user_id == user_id)
+    if after is not None:
+        updated_at, conversation_id = after
+        query = query.filter(keyset_before(models.Conversation, updated_at, conversation_id))
+    result = await db.execute(
+        query.order_by(models.Conversation.updated_at.desc(), models.Conversation.id.desc()).limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def delete_conversation(db: AsyncSession, user_id: int, conversation_id: int):
+    db_conversation = await get_conversation(db, user_id, conversation_id)
+    if not db_conversation:
+        return False
+    await db.execute(delete(models.ChatMessage).filter(
+        models.ChatMessage.user_id == user_id,
+        models.ChatMessage.conversation_id == conversation_id
+    ))
+    await db.delete(db_conversation)
+    await db.commit()
+    return True
+
+
+async def append_chat_messages(db: AsyncSession, db_conversation: models.Conversation, messages: list, retries: int = 3):
+    """在会话末尾追加消息并更新会话的消息数和更新时间，返回最后一条消息的序号；并发追加导致序号冲突时重试"""
+    for attempt in range(retries):
+        last_seq = await get_last_chat_seq(db, db_conversation.user_id, db_conversation.id)
+        for offset, message in enumerate(messages, start=1):
+            db.add(models.ChatMessage(
+                user_id=db_conversation.user_id,
+                conversation_id=db_conversation.id,
+                seq=last_seq + offset,
+                role=message.role,
+                content=message.content,
+            ))
+        db_conversation.message_count = (db_conversation.message_count or 0) + len(messages)
+        db_conversation.updated_at = datetime.now()
+        if not db_conversation.title:
+            # 没有标题的会话用第一条用户消息作为标题
+            first_question = next((message.content for message in messages if message.role == "user"), "")
+            db_conversation.title = first_question.strip()[:50]
+        try:
+            await db.commit()
+            return last_seq + len(messages)
+        except IntegrityError:
+            await db.rollback()
+            if attempt == retries - 1:
+                raise
+            await db.refresh(db_conversation)
+
+
+async def get_chat_messages(db: AsyncSession, user_id: int, conversation_id: int, after_seq: int = 0,
+                            limit: int = 100, before_seq: int | None = None, newest_first: bool = False):
+    """按序号分页读取会话消息：默认返回序号大于 after_seq 的最早 limit 条；
+    newest_first 时返回序号小于 before_seq（未指定则不限）的最新 limit 条，按序号倒序"""
+    query = select(models.ChatMessage).filter(
+        models.ChatMessage.user_id == user_id,
+        models.ChatMessage.conversation_id == conversation_id
+    )
+    if newest_first:
+        if before_seq is not None:
+            query = query.filter(models.ChatMessage.seq < before_seq)
+        query = query.order_by(models.ChatMessage.seq.desc())
+    else:
+        query = query.filter(models.ChatMessage.seq > after_seq).order_by(models.ChatMessage.seq)
+    result = await db.execute(query.limit(limit))
+    return result.scalars().all()
+
+
+async def truncate_chat_messages(db: AsyncSession, db_conversation: models.Conversation, after_seq: int = 0):
+    """删除会话中序号大于 after_seq 的消息，返回删除的条数"""
+    result = await db.execute(delete(models.ChatMessage).filter(
+        models.ChatMessage.user_id == db_conversation.user_id,
+        models.ChatMessage.conversation_id == db_conversation.id,
+        models.ChatMessage.seq > after_seq
+    ))
+    db_conversation.message_count = await count_chat_messages(db, db_conversation.user_id, db_conversation.id)
+    db_conversation.updated_at = datetime.now()
+    await db.commit()
+    return result.rowcount
+
+
+def extract_writing_summary(writing_data: str):
+    """从写作数据（前端保存的 JSON：paperTitle、passages 等）中提取标题、字节数和段落数"""
+    title = ""
+    paragraph_count = 0
+    try:
+        data = json.loads(writing_data or "")
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        if isinstance(data.get("paperTitle"), str):
+            title = data["paperTitle"].strip()[:256]
+        if isinstance(data.get("passages"), list):
+            paragraph_count = len(data["passages"])
+    return {
+        "title": title,
+        "data_size": len((writing_data or "").encode("utf-8")),
+        "paragraph_count": paragraph_count,
+    }
+
+
+def set_writing_data(writing_history: models.WritingHistory, writing_data: str):
+    """写入正文并同步更新元数据列"""
+    writing_history.writing_data = writing_data
+    for key, value in extract_writing_summary(writing_data).items():
+        setattr(writing_history, key, value)
+
+
+async def get_writing_history(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.WritingHistory).filter(models.WritingHistory.user_id == user_id))
+    return result.scalars().first()
 
 
-def create_writing_history(db: Session, user_id: int, writing_data: str):
-    db_writing_history = models.WritingHistory(user_id=user_id, writing_data=writing_data)
+async def create_writing_history(db: AsyncSession, user_id: int, writing_data: str):
+    db_writing_history = models.WritingHistory(user_id=user_id)
+    set_writing_data(db_writing_history, writing_data)
     db.add(db_writing_history)
-    db.commit()
-    db.refresh(db_writing_history)
+    await db.commit()
+    await db.refresh(db_writing_history)
     return db_writing_history
 
 
-def update_writing_history(db: Session, user_id: int, writing_data: str):
-    db_writing_history = get_writing_history(db, user_id)
+async def update_writing_history(db: AsyncSession, user_id: int, writing_data: str):
+    db_writing_history = await get_writing_history(db, user_id)
     if db_writing_history:
-        db_writing_history.writing_data = writing_data
+        set_writing_data(db_writing_history, writing_data)
         # 删除了 updated_at 时间戳更新
-        db.commit()
-        db.refresh(db_writing_history)
+        await db.commit()
+        await db.refresh(db_writing_history)
         return db_writing_history
     return None
 
 
-def delete_writing_history(db: Session, user_id: int):
-    db_writing_history = get_writing_history(db, user_id)
+async def delete_writing_history(db: AsyncSession, user_id: int):
+    db_writing_history = await get_writing_history(db, user_id)
     if db_writing_history:
-        db.delete(db_writing_history)
-        db.commit()
+        await db.delete(db_writing_history)
+        await db.commit()
         return True
     return False
 
 
-def get_all_writing_histories_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+async def get_all_writing_histories_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
     """获取用户的所有写作历史记录"""
-    return db.query(models.WritingHistory).filter(models.WritingHistory.user_id == user_id).offset(skip).limit(limit).all()
+    result = await db.execute(
+        select(models.WritingHistory).filter(models.WritingHistory.user_id == user_id)
+        .order_by(models.WritingHistory.id).offset(skip).limit(limit)
+    )
+    return result.scalars().all()
 
 
-def delete_writing_history_by_id(db: Session, writing_id: int, user_id: int):
-    """删除指定ID的写作历史记录，并验证该历史属于指定用户"""
-    writing_history = db.query(models.WritingHistory).filter(
+async def get_writing_versions_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
+    """与 get_all_writing_histories_by_user 相同范围内各记录的 (id, version)，不读取正文，用于计算 ETag"""
+    result = await db.execute(
+        select(models.WritingHistory.id, models.WritingHistory.version)
+        .filter(models.WritingHistory.user_id == user_id)
+        .order_by(models.WritingHistory.id).offset(skip).limit(limit)
+    )
+    return result.all()
+
+
+async def get_writing_version_by_id(db: AsyncSession, writing_id: int, user_id: int):
+    """指定写作历史的版本号，不存在时返回 None"""
+    return await db.scalar(select(models.WritingHistory.version).filter(
         models.WritingHistory.id == writing_id,
         models.WritingHistory.user_id == user_id
-    ).first()
+    ))
+
+
+async def get_writing_summaries_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
+    """获取用户写作历史的元数据列表，只查询元数据列，不读取 writing_data。
+    只读：尚未运行 migrate_writing_summary.py 补全的旧记录，元数据返回 None"""
+    result = await db.execute(
+        select(models.WritingHistory)
+        .options(load_only(
+            models.WritingHistory.id,
+            models.WritingHistory.user_id,
+            models.WritingHistory.title,
+            models.WritingHistory.data_size,
+            models.WritingHistory.paragraph_count,
+            models.WritingHistory.created_at,
+            models.WritingHistory.updated_at,
+        ))
+        .filter(models.WritingHistory.user_id == user_id)
+        .order_by(models.WritingHistory.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def delete_writing_history_by_id(db: AsyncSession, writing_id: int, user_id: int):
+    """删除指定ID的写作历史记录，并验证该历史属于指定用户"""
+    writing_history = await get_writing_history_by_id(db, writing_id, user_id)
     
     if not writing_history:
         return False
     
-    db.delete(writing_history)
-    db.commit()
+    await db.delete(writing_history)
+    await db.commit()
     return True
 
 
-def get_writing_history_by_id(db: Session, writing_id: int, user_id: int):
+async def get_writing_history_by_id(db: AsyncSession, writing_id: int, user_id: int):
     """根据ID和用户ID获取指定写作历史记录"""
-    return db.query(models.WritingHistory).filter(
+    result = await db.execute(select(models.WritingHistory).filter(
         models.WritingHistory.id == writing_id,
         models.WritingHistory.user_id == user_id
-    ).first()
+    ))
+    return result.scalars().first()
 
 
-def update_writing_history_by_id(db: Session, writing_id: int, user_id: int, writing_data: str):
+async def update_writing_history_by_id(db: AsyncSession, writing_id: int, user_id: int, writing_data: str):
     """更新指定ID的写作历史记录，并验证该历史属于指定用户"""
-    writing_history = db.query(models.WritingHistory).filter(
-        models.WritingHistory.id == writing_id,
-        models.WritingHistory.user_id == user_id
-    ).first()
+    writing_history = await get_writing_history_by_id(db, writing_id, user_id)
     
     if not writing_history:
         return None
     
-    writing_history.writing_data = writing_data
+    set_writing_data(writing_history, writing_data)
     writing_history.updated_at = datetime.now()  # 现在可以正确使用datetime
-    db.commit()
-    db.refresh(writing_history)
+    await db.commit()
+    await db.refresh(writing_history)
+    return writing_history
+
+class VersionConflictError(Exception):
+    """写作历史已被其他请求修改，修改所基于的版本不是最新版本"""
+
+    def __init__(self, current_version):
+        super().__init__(f"写作历史已被修改，当前版本为 {current_version}")
+        self.current_version = current_version
+
+
+async def patch_writing_history_by_id(db: AsyncSession, writing_id: int, user_id: int, version: int, operations: list):
+    """在服务端把 JSON Patch 应用到指定写作历史上，返回更新后的记录（不存在时返回 None）。
+    version 不是当前版本时抛出 VersionConflictError，补丁无法应用时抛出 JsonPatchError"""
+    writing_history = await get_writing_history_by_id(db, writing_id, user_id)
+    if not writing_history:
+        return None
+    if writing_history.version != version:
+        raise VersionConflictError(writing_history.version)
+
+    try:
+        document = json.loads(writing_history.writing_data or "{}")
+    except ValueError:
+        raise json_patch.JsonPatchError("写作数据不是有效的 JSON，无法应用补丁")
+    document = json_patch.apply_patch(document, operations)
+    # 与前端 JSON.stringify 的格式一致
+    set_writing_data(writing_history, json.dumps(document, ensure_ascii=False, separators=(",", ":")))
+    writing_history.updated_at = datetime.now()
+    try:
+        # UPDATE ... WHERE version = 旧版本号，期间被其他请求修改时不更新任何行
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        current_version = await db.scalar(
+            select(models.WritingHistory.version).filter(models.WritingHistory.id == writing_id)
+        )
+        raise VersionConflictError(current_version)
     return writing_history
 
-def count_writing_histories(db: Session, user_id: int):
-    """计算用户的写作历史总数"""
-    return db.query(models.WritingHistory).filter(models.WritingHistory.user_id == user_id).count()
+
+async def list_writing_histories_page(db: AsyncSession, user_id: int, limit: int = 100, skip: int = 0,
+                                      after=None, with_total: bool = True):
+    """按最近更新时间倒序分页获取用户的写作历史，走 (user_id, updated_at) 索引；
+    after 为上一页最后一条的 (updated_at, id)，传入时按键集分页，忽略 skip"""
+    query = select(models.WritingHistory).filter(models.WritingHistory.user_id == user_id)
+    page_query = query.order_by(
+        models.WritingHistory.updated_at.desc(), models.WritingHistory.id.desc()
+    ).limit(limit)
+    if after is not None:
+        updated_at, writing_id = after
+        page_query = page_query.filter(keyset_before(models.WritingHistory, updated_at, writing_id))
+    else:
+        page_query = page_query.offset(skip)
+    return await fetch_page(db, query, page_query, with_total=with_total)
@@ -0,0 +1,89 @@
+class JsonPatchError(ValueError):
+    """补丁操作无法应用到文档上"""
+
+
+def _parse_pointer(path):
+    """把 JSON Pointer（RFC 6901，如 /passages/0/passage）拆分为各级键"""
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise JsonPatchError(f"无效的路径: {path}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def _list_index(container, token, allow_end=False):
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"无效的数组下标: {token}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"数组下标越界: {token}")
+    return index
+
+
+def _resolve_parent(document, tokens, path):
+    """返回路径最后一级所在的容器"""
+    container = document
+    for token in tokens[:-1]:
+        if isinstance(container, dict) and token in container:
+            container = container[token]
+        elif isinstance(container, list):
+            container = container[_list_index(container, token)]
+        else:
+            raise JsonPatchError(f"路径不存在: {path}")
+    if not isinstance(container, (dict, list)):
+        raise JsonPatchError(f"路径不存在: {path}")
+    return container
+
+
+def apply_patch(document, operations):
+    """把 JSON Patch（RFC 6902 中的 add、remove、replace、test）依次应用到文档上，原地修改并返回文档。
+    operations 为包含 op、path、value 的字典列表；任一操作失败时抛出 JsonPatchError，调用方应丢弃修改后的文档"""
+    for operation in operations:
+        op = operation.get("op")
+        path = operation.get("path", "")
+        tokens = _parse_pointer(path)
+        if op == "test":
+            if _get(document, tokens, path) != operation.get("value"):
+                raise JsonPatchError(f"test 操作不匹配: {path}")
+            continue
+        if op not in ("add", "remove", "replace"):
+            raise JsonPatchError(f"不支持的操作: {op}")
+        if not tokens:
+            # 整个文档
+            if op == "remove":
+                raise JsonPatchError("不能删除整个文档")
+            document = operation.get("value")
+            continue
+
+        container = _resolve_parent(document, tokens, path)
+        token = tokens[-1]
+        if isinstance(container, list):
+            index = _list_index(container, token, allow_end=(op == "add"))
+            if op == "add":
+                container.insert(index, operation.get("value"))
+            elif op == "remove":
+                del container[index]
+            else:
+                container[index] = operation.get("value")
+        else:
+            if op != "add" and token not in container:
+                raise JsonPatchError(f"路径不存在: {path}")
+            if op == "remove":
+                del container[token]
+            else:
+                container[token] = operation.get("value")
+    return document
+
+
+def _get(document, tokens, path):
+    value = document
+    for token in tokens:
+        if isinstance(value, dict) and token in value:
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_list_index(value, token)]
+        else:
+            raise JsonPatchError(f"路径不存在: {path}")
+    return value
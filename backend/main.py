@@ -3,25 +3,37 @@ from typing import Annotated
 import subprocess
 import time
 import os
+import json
+import hashlib
 
 import jwt
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
 from pydantic import BaseModel
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 import sqlalchemy.exc
 
+import compression
 import crud, models, schemas
-from database import SessionLocal, engine
-from security import verify_password
+import json_patch
+import pagination
+from database import AsyncSessionLocal, engine, get_pool_stats
+import security
+from user_cache import user_cache
 
 import requests
 from fastapi import FastAPI
 from proxy import router as proxy_router
+import proxy
+from http_compression import CompressionMiddleware
 
 app = FastAPI()
+# 压缩写作历史、聊天记录等较大的 JSON 响应
+app.add_middleware(CompressionMiddleware)
 
 
 # to get a string like this run:
@@ -86,20 +98,24 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 # Dependency
-def get_session():
-    with SessionLocal() as session:
+async def get_session():
+    async with AsyncSessionLocal() as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = crud.get_user_by_username(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await crud.get_user_by_username(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt 在专用线程池中计算，不阻塞其他请求
+    valid, new_hash = await security.verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        await crud.update_password_hash(db, user, new_hash)
     return user
 
 
@@ -131,9 +147,15 @@ async def get_current_user(
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
+    # 常见情况下直接命中缓存，不查询数据库；缓存的是不可变快照而不是 ORM 对象
+    user = user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        version = user_cache.version(token_data.username)
+        db_user = await crud.get_user_by_username(db, username=token_data.username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.UserWithID.model_validate(db_user)
+        user_cache.set(token_data.username, user, version)
     return user
 
 
@@ -150,7 +172,7 @@ async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     db: SessionDep
 ) -> Token:
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -172,11 +194,21 @@ async def read_users_me(
 
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: SessionDep):
-    db_user = crud.get_user_by_username(db, user.username)
+async def create_user(user: schemas.UserCreate, db: SessionDep):
+    db_user = await crud.get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user(db=db, user=user)
+
+
+def parse_cursor(cursor: str | None, size: int):
+    """解析分页游标，未传入时返回 None，格式错误时返回400"""
+    if not cursor:
+        return None
+    values = pagination.decode_cursor(cursor)
+    if values is None or len(values) != size:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return values
 
 
 @app.get("/users/", response_model=schemas.UserList)
@@ -184,10 +216,21 @@ async def read_users(
         current_user: Annotated[schemas.User, Depends(get_current_active_user)],
         db: SessionDep,
         skip: int = 0,
-        limit: int = 100,
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: str | None = None,
+        with_total: bool = True,
 ):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return schemas.UserList(total=crud.count_users(db), users=users)
+    """按 id 顺序分页列出用户。传入上一页返回的 next_cursor 时按键集分页（忽略 skip），
+    翻页耗时不随页数增加；总数与用户列表在同一条查询中得到，with_total=false 时不统计"""
+    after = parse_cursor(cursor, 1)
+    users, total = await crud.get_users_page(
+        db, limit=limit + 1, skip=skip, after_id=after[0] if after else None, with_total=with_total
+    )
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = pagination.encode_cursor(users[-1].id)
+    return schemas.UserList(total=total, users=users, next_cursor=next_cursor)
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
@@ -196,7 +239,7 @@ async def read_user(
         user_id: int,
         db: SessionDep
 ):
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -210,12 +253,12 @@ async def delete_user(
 ):
 
     # 检查用户是否存在
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     
     # 删除用户
-    crud.delete_user(db, user_id=user_id)
+    await crud.delete_user(db, user_id=user_id)
     return None  # 204状态码不需要返回内容
 
 
@@ -226,7 +269,7 @@ async def read_user(
         db: SessionDep
 ):
     # print(current_user.username)
-    db_user = crud.get_user_by_username(db, username=username)
+    db_user = await crud.get_user_by_username(db, username=username)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -245,12 +288,12 @@ async def delete_user_by_username(
     #    )
     
     # 检查用户是否存在
-    db_user = crud.get_user_by_username(db, username=username)
+    db_user = await crud.get_user_by_username(db, username=username)
     if db_user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     
     # 删除用户
-    crud.delete_user_by_username(db, username=username)
+    await crud.delete_user_by_username(db, username=username)
     return None
 
 
@@ -269,12 +312,12 @@ async def update_user_by_username(
     #    )
     
     # 检查用户是否存在
-    db_user = crud.get_user_by_username(db, username=username)
+    db_user = await crud.get_user_by_username(db, username=username)
     if db_user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     
     # 更新用户信息
-    updated_user = crud.update_user_by_username(db, username=username, user_update=user_update)
+    updated_user = await crud.update_user_by_username(db, username=username, user_update=user_update)
     if updated_user is None:
         raise HTTPException(status_code=500, detail="更新用户信息失败")
     
@@ -294,7 +337,7 @@ async def chat(
                 'content': chat_request.prompt,
             }
         ]
-    })
+    }, headers={'X-User': current_user.username})  # 算法层按用户公平排队
     return schemas.ChatResponse(response=resp.json()['choices'][0]['message']['content'])
 
 
@@ -302,6 +345,38 @@ async def chat(
 app.include_router(proxy_router, prefix="/proxy")
 
 
+@app.exception_handler(security.PasswordHashBusyError)
+async def password_hash_busy_handler(request: Request, exc: security.PasswordHashBusyError):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(crud.VersionConflictError)
+async def version_conflict_handler(request: Request, exc: crud.VersionConflictError):
+    return JSONResponse(status_code=409, content={"detail": str(exc), "version": exc.current_version})
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    # 两个请求同时更新同一条写作历史，后提交的一方没有更新到任何行
+    return JSONResponse(status_code=409, content={"detail": "数据已被其他请求修改，请刷新后重试"})
+
+
+@app.exception_handler(json_patch.JsonPatchError)
+async def json_patch_error_handler(request: Request, exc: json_patch.JsonPatchError):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+@app.get("/metrics/")
+async def metrics():
+    return {
+        "db_pool": get_pool_stats(),
+        "user_cache": user_cache.get_stats(),
+        "password_hashing": security.get_stats(),
+        "compression": compression.get_stats(),
+        "image_proxy": proxy.get_stats(),
+    }
+
+
 @app.post("/verify-password", response_model=schemas.VerifyPasswordResponse)
 async def verify_password_endpoint(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
@@ -316,7 +391,7 @@ async def verify_password_endpoint(
     #    )
     
     # 验证密码
-    user = authenticate_user(db, verify_request.username, verify_request.password)
+    user = await authenticate_user(db, verify_request.username, verify_request.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -326,62 +401,214 @@ async def verify_password_endpoint(
     return schemas.VerifyPasswordResponse(success=True)
 
 
+def not_modified(request: Request, response: Response, etag: str):
+    """设置 ETag 并要求浏览器每次使用前重新验证；If-None-Match 与 ETag 相同时返回 304 响应，否则返回 None"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    # 弱比较：忽略 W/ 前缀（压缩后的响应体与 ETag 对应的内容仍相同）
+    requested = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if "*" in requested or etag.removeprefix("W/") in requested:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+async def read_all_chat_messages(db: AsyncSession, user_id: int, conversation_id: int, page_size: int = 1000):
+    messages = []
+    while True:
+        page = await crud.get_chat_messages(db, user_id, conversation_id, after_seq=messages[-1].seq if messages else 0, limit=page_size)
+        messages.extend(page)
+        if len(page) < page_size:
+            return messages
+
+
+async def get_conversation_or_404(db: AsyncSession, user_id: int, conversation_id: int, create: bool = True):
+    """create 为 False 时（读取接口）默认会话不存在也不创建，返回404"""
+    conversation = await crud.resolve_conversation(db, user_id, conversation_id, create=create)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return conversation
+
+
 @app.post("/save/chat/", response_model=schemas.ChatHistory)
 async def save_chat_history(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     chat_data: schemas.ChatHistoryCreate,
     db: SessionDep
 ):
-    # 检查用户是否已有聊天历史
-    existing_history = crud.get_chat_history(db, current_user.id)
+    """兼容旧接口：提交默认会话的完整聊天记录，只写入与已保存记录不同的部分"""
+    conversation = await crud.get_default_conversation(db, current_user.id)
+    new_messages = crud.parse_chat_data(chat_data.chat_data)
+    existing = await crud.get_chat_messages(db, current_user.id, conversation.id, limit=len(new_messages) + 1)
     
-    if existing_history:
-        # 更新现有聊天历史
-        updated_history = crud.update_chat_history(db, current_user.id, chat_data.chat_data)
-        if updated_history is None:
-            raise HTTPException(status_code=500, detail="更新聊天历史失败")
-        return updated_history
-    else:
-        # 创建新的聊天历史
-        return crud.create_chat_history(db, current_user.id, chat_data.chat_data)
+    # 找出与已保存记录相同的前缀，删除之后的旧消息，再追加新消息
+    common = 0
+    while common < min(len(existing), len(new_messages)) and \
+            (existing[common].role, existing[common].content) == new_messages[common]:
+        common += 1
+    if common < len(existing):
+        await crud.truncate_chat_messages(db, conversation, after_seq=existing[common - 1].seq if common else 0)
+    if common < len(new_messages):
+        await crud.append_chat_messages(db, conversation, [
+            schemas.ChatMessageCreate(role=role, content=content) for role, content in new_messages[common:]
+        ])
+    return schemas.ChatHistory(id=conversation.id, user_id=current_user.id, chat_data=chat_data.chat_data)
 
 
 @app.get("/get/chat/", response_model=schemas.ChatHistory)
 async def get_chat_history(
+    request: Request,
+    response: Response,
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     db: SessionDep
 ):
-    # 获取用户的聊天历史
-    chat_history = crud.get_chat_history(db, current_user.id)
-    if not chat_history:
+    """兼容旧接口：以 JSON 数组返回默认会话的完整聊天记录；会话未变化时返回304。只读，不创建默认会话"""
+    conversation = await crud.get_default_conversation(db, current_user.id, create=False)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="聊天历史不存在")
-    return chat_history
+    # 追加、截断消息都会更新会话的消息数和更新时间
+    etag = f'W/"chat-{conversation.id}-{conversation.message_count}-{conversation.updated_at.timestamp()}"'
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+    messages = await read_all_chat_messages(db, current_user.id, conversation.id)
+    if not messages:
+        raise HTTPException(status_code=404, detail="聊天历史不存在")
+    chat_data = json.dumps([{"role": m.role, "content": m.content} for m in messages], ensure_ascii=False)
+    return schemas.ChatHistory(id=conversation.id, user_id=current_user.id, chat_data=chat_data)
+
+
+@app.post("/append/chat/", response_model=schemas.ChatMessagesAppendResponse)
+async def append_chat_messages(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    append_request: schemas.ChatMessagesAppend,
+    db: SessionDep
+):
+    """在会话末尾追加消息，只写入新消息"""
+    conversation = await get_conversation_or_404(db, current_user.id, append_request.conversation_id)
+    if append_request.messages:
+        last_seq = await crud.append_chat_messages(db, conversation, append_request.messages)
+    else:
+        last_seq = await crud.get_last_chat_seq(db, current_user.id, conversation.id)
+    return schemas.ChatMessagesAppendResponse(conversation_id=conversation.id, last_seq=last_seq)
+
+
+@app.get("/get/chat/messages/", response_model=schemas.ChatMessagePage)
+async def get_chat_messages(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    db: SessionDep,
+    conversation_id: int = 0,
+    after_seq: int = 0,
+    before_seq: int | None = None,
+    latest: bool = False,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """按序号分页读取会话消息：
+    默认从 after_seq 向后读，下一页用返回的 next_seq 作为 after_seq；
+    latest=true 读取最新一页，before_seq 读取更早的一页，再往前用返回的 prev_seq 作为 before_seq"""
+    conversation = await get_conversation_or_404(db, current_user.id, conversation_id, create=False)
+    newest_first = latest or before_seq is not None
+    messages = await crud.get_chat_messages(
+        db, current_user.id, conversation.id,
+        after_seq=after_seq, before_seq=before_seq, newest_first=newest_first, limit=limit + 1
+    )
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if newest_first:
+        messages.reverse()
+    return schemas.ChatMessagePage(
+        conversation_id=conversation.id,
+        messages=messages,
+        next_seq=messages[-1].seq if messages else after_seq,
+        prev_seq=messages[0].seq if messages else (before_seq or 0),
+        has_more=has_more
+    )
 
 
 @app.delete("/delete/chat/", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_chat_history(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
-    db: SessionDep
+    db: SessionDep,
+    conversation_id: int = 0
 ):
-    # 删除用户的聊天历史
-    result = crud.delete_chat_history(db, current_user.id)
-    if not result:
+    # 清空会话中的消息（默认会话同时删除旧格式的整段记录），会话本身保留
+    legacy_deleted = conversation_id == 0 and await crud.delete_chat_history(db, current_user.id)
+    conversation = await get_conversation_or_404(db, current_user.id, conversation_id)
+    deleted = await crud.truncate_chat_messages(db, conversation)
+    if not legacy_deleted and not deleted:
         raise HTTPException(status_code=404, detail="聊天历史不存在")
     return None  # 204状态码不需要返回内容
 
 
+@app.post("/create/conversation/", response_model=schemas.Conversation)
+async def create_conversation(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    conversation: schemas.ConversationCreate,
+    db: SessionDep
+):
+    return await crud.create_conversation(db, current_user.id, conversation.title)
+
+
+@app.get("/list/conversations/", response_model=schemas.ConversationList)
+async def list_conversations(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    db: SessionDep,
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """按最近更新时间倒序列出会话，下一页用返回的 next_cursor 作为 cursor"""
+    after = parse_cursor(cursor, 2)
+    conversations = await crud.list_conversations(db, current_user.id, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_cursor = pagination.encode_cursor(conversations[-1].updated_at, conversations[-1].id)
+    return schemas.ConversationList(conversations=conversations, next_cursor=next_cursor)
+
+
+@app.delete("/delete/conversation/{conversation_id}/", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_conversation(
+    conversation_id: int,
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    db: SessionDep
+):
+    """删除会话及其全部消息"""
+    if not await crud.delete_conversation(db, current_user.id, conversation_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return None  # 204状态码不需要返回内容
+
+
 @app.post("/users/id-by-username/", response_model=schemas.UserID)
 async def get_user_id_by_username(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     username_request: schemas.UsernameRequest,
     db: SessionDep
 ):
-    db_user = crud.get_user_by_username(db, username=username_request.username)
+    db_user = await crud.get_user_by_username(db, username=username_request.username)
     if db_user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     return {"id": db_user.id}
 
 
+@app.post("/users/batch/", response_model=schemas.UserBatch)
+async def read_users_batch(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    batch_request: schemas.UserBatchRequest,
+    db: SessionDep
+):
+    """一次请求按用户名和/或 id 批量查询用户（每种最多 USER_BATCH_MAX 个），代替逐个调用单用户接口。
+    两种查询都先查用户缓存，未命中的各用一条 IN 查询取出；查不到的列在 missing_* 中"""
+    by_username = await crud.get_users_by_usernames(db, batch_request.usernames)
+    by_id = await crud.get_users_by_ids(db, batch_request.ids)
+    users = {}
+    for user in list(by_username.values()) + list(by_id.values()):
+        users.setdefault(user.id, user)
+    return schemas.UserBatch(
+        users=list(users.values()),
+        missing_usernames=[name for name in dict.fromkeys(batch_request.usernames) if name not in by_username],
+        missing_ids=[user_id for user_id in dict.fromkeys(batch_request.ids) if user_id not in by_id],
+    )
+
+
 @app.post("/save/writing/", response_model=schemas.WritingHistory)
 async def save_writing_history(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
@@ -389,17 +616,17 @@ async def save_writing_history(
     db: SessionDep
 ):
     # 检查用户是否已有写作历史
-    existing_history = crud.get_writing_history(db, current_user.id)
+    existing_history = await crud.get_writing_history(db, current_user.id)
     
     if existing_history:
         # 更新现有写作历史
-        updated_history = crud.update_writing_history(db, current_user.id, writing_data.writing_data)
+        updated_history = await crud.update_writing_history(db, current_user.id, writing_data.writing_data)
         if updated_history is None:
             raise HTTPException(status_code=500, detail="更新写作历史失败")
         return updated_history
     else:
         # 创建新的写作历史
-        return crud.create_writing_history(db, current_user.id, writing_data.writing_data)
+        return await crud.create_writing_history(db, current_user.id, writing_data.writing_data)
 
 
 @app.get("/get/writing/", response_model=schemas.WritingHistory)
@@ -408,7 +635,7 @@ async def get_writing_history(
     db: SessionDep
 ):
     # 获取用户的写作历史
-    writing_history = crud.get_writing_history(db, current_user.id)
+    writing_history = await crud.get_writing_history(db, current_user.id)
     if not writing_history:
         raise HTTPException(status_code=404, detail="写作历史不存在")
     return writing_history
@@ -419,12 +646,21 @@ async def list_writing_histories(
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     db: SessionDep,
     skip: int = 0,
-    limit: int = 100
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    with_total: bool = True
 ):
-    # 获取用户的所有写作历史列表
-    writing_histories = crud.get_all_writing_histories(db, user_id=current_user.id, skip=skip, limit=limit)
-    total = crud.count_writing_histories(db, user_id=current_user.id)
-    return schemas.WritingHistoryList(total=total, writing_histories=writing_histories)
+    # 按最近更新时间倒序获取写作历史列表，传入 next_cursor 时按键集分页
+    after = parse_cursor(cursor, 2)
+    writing_histories, total = await crud.list_writing_histories_page(
+        db, current_user.id, limit=limit + 1, skip=skip, after=after, with_total=with_total
+    )
+    next_cursor = None
+    if len(writing_histories) > limit:
+        writing_histories = writing_histories[:limit]
+        last = writing_histories[-1]
+        next_cursor = pagination.encode_cursor(last.updated_at, last.id)
+    return schemas.WritingHistoryList(total=total, writing_histories=writing_histories, next_cursor=next_cursor)
 
 
 @app.post("/create/writing/", response_model=schemas.WritingHistory)
@@ -434,7 +670,7 @@ async def create_writing_history(
     db: SessionDep
 ):
     # 创建新的写作历史
-    return crud.create_writing_history(db, current_user.id, writing_data.writing_data)
+    return await crud.create_writing_history(db, current_user.id, writing_data.writing_data)
 
 
 @app.delete("/delete/writing/", status_code=status.HTTP_204_NO_CONTENT)
@@ -443,7 +679,7 @@ async def delete_writing_history(
     db: SessionDep
 ):
     # 删除用户的写作历史
-    result = crud.delete_writing_history(db, current_user.id)
+    result = await crud.delete_writing_history(db, current_user.id)
     if not result:
         raise HTTPException(status_code=404, detail="写作历史不存在")
     return None  # 204状态码不需要返回内容
@@ -453,19 +689,37 @@ async def delete_writing_history(
 
 @app.get("/get/writing/all/", response_model=list[schemas.WritingHistory])
 async def get_all_writing_histories(
+    request: Request,
+    response: Response,
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     db: SessionDep,
     skip: int = 0,
     limit: int = 100
 ):
-    """获取当前用户的所有写作历史记录"""
+    """获取当前用户的所有写作历史记录；各记录的版本号都未变化时返回304，不读取正文"""
+    versions = await crud.get_writing_versions_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+    digest = hashlib.sha1(json.dumps([list(row) for row in versions]).encode()).hexdigest()[:20]
+    cached = not_modified(request, response, f'W/"writings-{digest}"')
+    if cached:
+        return cached
     # 获取用户的所有写作历史
-    writing_histories = crud.get_all_writing_histories_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+    writing_histories = await crud.get_all_writing_histories_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
     if not writing_histories:
         return []
     return writing_histories
 
 
+@app.get("/list/writings/summary/", response_model=list[schemas.WritingHistorySummary])
+async def list_writing_summaries(
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    db: SessionDep,
+    skip: int = 0,
+    limit: int = 100
+):
+    """获取当前用户写作历史的标题、大小、段落数和时间，不返回正文；正文通过 /get/writing/{writing_id}/ 获取"""
+    return await crud.get_writing_summaries_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+
+
 @app.delete("/delete/writing/{writing_id}/", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_writing_history_by_id(
     writing_id: int,
@@ -474,7 +728,7 @@ async def delete_writing_history_by_id(
 ):
     """删除指定ID的写作历史记录"""
     # 删除指定ID的写作历史，并验证该历史属于当前用户
-    result = crud.delete_writing_history_by_id(db, writing_id, current_user.id)
+    result = await crud.delete_writing_history_by_id(db, writing_id, current_user.id)
     if not result:
         raise HTTPException(status_code=404, detail="写作历史不存在或无权限删除")
     return None  # 204状态码不需要返回内容
@@ -489,7 +743,23 @@ async def update_writing_history_by_id(
 ):
     """更新指定ID的写作历史记录"""
     # 更新指定ID的写作历史，并验证该历史属于当前用户
-    updated_history = crud.update_writing_history_by_id(db, writing_id, current_user.id, writing_data.writing_data)
+    updated_history = await crud.update_writing_history_by_id(db, writing_id, current_user.id, writing_data.writing_data)
+    if updated_history is None:
+        raise HTTPException(status_code=404, detail="写作历史不存在或无权限更新")
+    return updated_history
+
+
+@app.patch("/update/writing/{writing_id}/", response_model=schemas.WritingHistoryVersion)
+async def patch_writing_history_by_id(
+    writing_id: int,
+    patch: schemas.WritingHistoryPatch,
+    current_user: Annotated[schemas.User, Depends(get_current_active_user)],
+    db: SessionDep
+):
+    """增量更新指定ID的写作历史：在服务端应用 JSON Patch，只返回新的版本号。
+    patch.version 不是当前版本时返回409，客户端应重新获取后再修改"""
+    operations = [operation.model_dump() for operation in patch.operations]
+    updated_history = await crud.patch_writing_history_by_id(db, writing_id, current_user.id, patch.version, operations)
     if updated_history is None:
         raise HTTPException(status_code=404, detail="写作历史不存在或无权限更新")
     return updated_history
@@ -498,11 +768,19 @@ async def update_writing_history_by_id(
 @app.get("/get/writing/{writing_id}/", response_model=schemas.WritingHistory)
 async def get_writing_history_by_id(
     writing_id: int,
+    request: Request,
+    response: Response,
     current_user: Annotated[schemas.User, Depends(get_current_active_user)],
     db: SessionDep
 ):
-    """根据ID获取指定写作历史记录"""
-    writing_history = crud.get_writing_history_by_id(db, writing_id, current_user.id)
+    """根据ID获取指定写作历史记录；版本号未变化时返回304，不读取正文"""
+    version = await crud.get_writing_version_by_id(db, writing_id, current_user.id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="写作历史不存在或无权限访问")
+    cached = not_modified(request, response, f'W/"writing-{writing_id}-{version}"')
+    if cached:
+        return cached
+    writing_history = await crud.get_writing_history_by_id(db, writing_id, current_user.id)
     if not writing_history:
         raise HTTPException(status_code=404, detail="写作历史不存在或无权限访问")
     return writing_history
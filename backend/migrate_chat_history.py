@@ -0,0 +1,94 @@
+"""
+把 chat_histories 表中旧格式的整段聊天记录迁移为用户默认会话（最早创建的会话）中的逐条消息，
+并把会话功能之前保存在会话0中的消息归入默认会话。接口不会在请求时迁移，升级后需要运行一次。
+
+用法：python migrate_chat_history.py [--dry-run]
+"""
+
+import argparse
+
+from sqlalchemy import func
+
+import models
+from crud import parse_chat_data
+from database import SessionLocal, engine
+
+
+def get_or_create_default_conversation(db, user_id):
+    conversation = db.query(models.Conversation).filter(
+        models.Conversation.user_id == user_id
+    ).order_by(models.Conversation.id).first()
+    if conversation is None:
+        conversation = models.Conversation(user_id=user_id, title="默认对话", message_count=0)
+        db.add(conversation)
+        db.flush()
+    return conversation
+
+
+def migrate_conversation_zero(db, dry_run):
+    """会话0中的消息归入默认会话，序号接在已有消息之后，返回 (用户数, 消息数)"""
+    rows = db.query(models.ChatMessage.user_id, func.count()).filter(
+        models.ChatMessage.conversation_id == 0
+    ).group_by(models.ChatMessage.user_id).all()
+    if dry_run:
+        return len(rows), sum(count for _, count in rows)
+    for user_id, _ in rows:
+        conversation = get_or_create_default_conversation(db, user_id)
+        last_seq = db.query(func.max(models.ChatMessage.seq)).filter(
+            models.ChatMessage.user_id == user_id,
+            models.ChatMessage.conversation_id == conversation.id
+        ).scalar() or 0
+        db.query(models.ChatMessage).filter(
+            models.ChatMessage.user_id == user_id,
+            models.ChatMessage.conversation_id == 0
+        ).update({
+            models.ChatMessage.conversation_id: conversation.id,
+            models.ChatMessage.seq: models.ChatMessage.seq + last_seq,
+        }, synchronize_session=False)
+        conversation.message_count = db.query(func.count(models.ChatMessage.id)).filter(
+            models.ChatMessage.user_id == user_id,
+            models.ChatMessage.conversation_id == conversation.id
+        ).scalar()
+        conversation.updated_at = func.now()
+        db.commit()
+    return len(rows), sum(count for _, count in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入数据库")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    migrated_users = 0
+    migrated_messages = 0
+    with SessionLocal() as db:
+        for chat_history in db.query(models.ChatHistory).all():
+            if chat_history.user_id is None:
+                continue
+            conversation = db.query(models.Conversation).filter(
+                models.Conversation.user_id == chat_history.user_id
+            ).order_by(models.Conversation.id).first()
+            # 默认会话已有消息时不再导入，只删除旧数据
+            messages = [] if conversation and conversation.message_count else parse_chat_data(chat_history.chat_data)
+            migrated_users += 1
+            migrated_messages += len(messages)
+            if args.dry_run:
+                continue
+            if conversation is None:
+                conversation = get_or_create_default_conversation(db, chat_history.user_id)
+            for seq, (role, content) in enumerate(messages, start=1):
+                db.add(models.ChatMessage(
+                    user_id=chat_history.user_id, conversation_id=conversation.id, seq=seq, role=role, content=content
+                ))
+            if messages:
+                conversation.message_count = len(messages)
+            db.delete(chat_history)
+            db.commit()
+        print(f"{'将迁移' if args.dry_run else '已迁移'} {migrated_users} 个用户的 {migrated_messages} 条整段聊天记录消息")
+        users, messages = migrate_conversation_zero(db, args.dry_run)
+    print(f"{'将归入' if args.dry_run else '已归入'}默认会话：{users} 个用户的 {messages} 条会话0消息")
+
+
+if __name__ == "__main__":
+    main()
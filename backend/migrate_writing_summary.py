@@ -0,0 +1,66 @@
+"""
+为已有的 writing_histories 表添加新增的列（元数据列 title、data_size、paragraph_count 和版本号 version），
+并从 writing_data 中提取元数据填充。启动时的自动建表不会修改已存在的表，升级后需要运行一次；
+列表接口是只读的，补全前旧记录的元数据返回 null。
+
+用法：python migrate_writing_summary.py [--batch-size 500]
+"""
+
+import argparse
+
+from sqlalchemy import inspect, text
+
+import models
+from crud import extract_writing_summary
+from database import SessionLocal, engine
+
+COLUMNS = {
+    "title": "VARCHAR(256)",
+    "data_size": "INTEGER",
+    "paragraph_count": "INTEGER",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    existing = {column["name"] for column in inspect(engine).get_columns("writing_histories")}
+    with engine.begin() as connection:
+        for name, column_type in COLUMNS.items():
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE writing_histories ADD COLUMN {name} {column_type}"))
+                print(f"已添加列 {name}")
+
+    table = models.WritingHistory.__table__
+    updated = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            rows = db.execute(
+                table.select()
+                .with_only_columns(table.c.id, table.c.writing_data)
+                .where(table.c.id > last_id, table.c.data_size.is_(None))
+                .order_by(table.c.id)
+                .limit(args.batch_size)
+            ).all()
+            if not rows:
+                break
+            for writing_id, writing_data in rows:
+                # 保留原来的更新时间
+                db.execute(
+                    table.update()
+                    .where(table.c.id == writing_id)
+                    .values(**extract_writing_summary(writing_data), updated_at=table.c.updated_at)
+                )
+            db.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+    print(f"已提取 {updated} 条写作历史的元数据")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 
 import datetime
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 
+from compression import CompressedText
 from database import Base
 
 
@@ -21,11 +22,12 @@ class User(Base):
 
 
 class ChatHistory(Base):
+    """旧的整段存储格式，读取或追加消息时迁移到 chat_messages"""
     __tablename__ = "chat_histories"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    chat_data = Column(String(10000))  # 存储JSON格式的聊天记录
+    chat_data = Column(CompressedText)  # 存储JSON格式的聊天记录，较大时压缩存储
     # 删除了 created_at 和 updated_at 字段
 
     user = relationship("User", back_populates="chat_histories")
@@ -36,10 +38,20 @@ User.chat_histories = relationship("ChatHistory", back_populates="user")
 
 class WritingHistory(Base):
     __tablename__ = "writing_histories"
+    # 按用户列出写作历史并按最近更新时间分页
+    __table_args__ = (Index("ix_writing_histories_user_updated", "user_id", "updated_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    writing_data = Column(Text)
+    writing_data = Column(CompressedText)  # 较大时压缩存储，见 compression.py
+    # 保存时从 writing_data 中提取的元数据，列表接口只读这些列；为 NULL 表示旧数据尚未提取
+    title = Column(String(256))
+    data_size = Column(Integer)
+    paragraph_count = Column(Integer)
+    # 乐观锁版本号：每次通过 ORM 更新时加一，UPDATE 语句带上旧版本号作为条件
+    version = Column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": version}
     created_at = Column(DateTime, default=datetime.datetime.now)
     updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
 
@@ -47,3 +59,40 @@ class WritingHistory(Base):
 
 # 在User模型中添加关系
 User.writing_histories = relationship("WritingHistory", back_populates="user", cascade="all, delete-orphan")
+
+
+class ChatMessage(Base):
+    """按消息存储的聊天记录，每条消息一行，seq 为会话内的序号"""
+    __tablename__ = "chat_messages"
+    # 唯一约束同时作为 (user_id, conversation_id, seq) 的索引，按会话顺序读取
+    __table_args__ = (UniqueConstraint("user_id", "conversation_id", "seq", name="uq_chat_messages_seq"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    conversation_id = Column(Integer, nullable=False, default=0)  # 对应 conversations.id，0为旧版本的默认会话
+    seq = Column(Integer, nullable=False)
+    role = Column(String(32))
+    content = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+    user = relationship("User", back_populates="chat_messages")
+
+User.chat_messages = relationship("ChatMessage", back_populates="user", cascade="all, delete-orphan")
+
+
+class Conversation(Base):
+    """聊天会话，message_count 和 updated_at 在追加消息时同步更新，列表无需统计消息表"""
+    __tablename__ = "conversations"
+    # 按最近更新时间分页列出用户的会话；InnoDB 二级索引隐含主键，(updated_at, id) 的排序也可走索引
+    __table_args__ = (Index("ix_conversations_user_updated", "user_id", "updated_at"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    title = Column(String(256), default="")
+    message_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    updated_at = Column(DateTime, default=datetime.datetime.now)
+
+    user = relationship("User", back_populates="conversations")
+
+User.conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
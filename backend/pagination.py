@@ -0,0 +1,23 @@
+import base64
+import datetime
+import json
+
+
+def encode_cursor(*values):
+    """把排序键编码为不透明的游标字符串，用于键集分页（按上一页最后一行的排序键继续查询）"""
+    items = [{"t": value.isoformat()} if isinstance(value, datetime.datetime) else value for value in values]
+    raw = json.dumps(items, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        items = json.loads(raw)
+        return [
+            datetime.datetime.fromisoformat(item["t"]) if isinstance(item, dict) else item
+            for item in items
+        ]
+    except (ValueError, TypeError, KeyError):
+        return None
@@ -1,31 +1,377 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import httpx
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
 
-from fastapi import APIRouter, Response, Query
-import requests
+# 访问远程图片使用的代理，设为空字符串时直连
+IMAGE_PROXY_UPSTREAM = os.getenv("IMAGE_PROXY_UPSTREAM", "http://localhost:7897")
+IMAGE_PROXY_TIMEOUT = float(os.getenv("IMAGE_PROXY_TIMEOUT", "10"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "cache/images")
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "256"))
+# 缓存的图片在该时间内直接使用，之后带上 ETag/Last-Modified 向源站验证
+IMAGE_CACHE_FRESH_SECONDS = int(os.getenv("IMAGE_CACHE_FRESH_SECONDS", "3600"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+# 缩略图（?size=）可选的边长，以及生成缩略图的进程数
+THUMBNAIL_SIZES = (32, 64, 128, 256)
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(min(2, os.cpu_count() or 1))))
+# 超过该像素数的图片不生成缩略图，防止解压炸弹
+THUMBNAIL_MAX_PIXELS = 40_000_000
 
 router = APIRouter()
 
-@router.get("/image")
-def proxy_image(url: str = Query(...)):
+
+class ImageTooLargeError(Exception):
+    """远程图片超过 IMAGE_MAX_BYTES"""
+
+
+class ImageCache:
+    """远程图片的磁盘缓存：正文和元数据（content-type、ETag、Last-Modified、获取时间）分别存为文件，
+    按总大小做 LRU 淘汰（读取时更新正文文件的修改时间）"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "stale_served": 0, "coalesced": 0,
+                       "errors": 0, "too_large": 0, "fetched_bytes": 0, "evictions": 0,
+                       "thumbnail_hits": 0, "thumbnails_generated": 0, "thumbnail_errors": 0,
+                       "thumbnail_seconds": 0.0}
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(
+            entry.stat().st_size for entry in os.scandir(directory)
+            if entry.is_file() and entry.name.endswith(".img")
+        )
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def body_path(self, key):
+        return os.path.join(self.directory, f"{key}.img")
+
+    def _meta_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """返回缓存条目的元数据，不存在时返回 None"""
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(self.body_path(key))
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def save_meta(self, key, meta):
+        tmp_path = f"{self._meta_path(key)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def store(self, key, tmp_path, meta):
+        """把下载好的临时文件放入缓存"""
+        body_path = self.body_path(key)
+        previous = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        os.replace(tmp_path, body_path)
+        self.save_meta(key, meta)
+        with self._lock:
+            self._bytes += meta["size"] - previous
+            over_limit = self._bytes > self.max_bytes
+        if over_limit:
+            self._evict(protected=key)
+
+    def _evict(self, protected=None):
+        """按最久未使用的顺序删除，直到降到上限的90%"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".img")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            with self._lock:
+                if self._bytes <= self.max_bytes * 0.9:
+                    break
+            key = entry.name[:-len(".img")]
+            if key == protected:
+                continue
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                os.remove(self._meta_path(key))
+            except OSError:
+                continue
+            with self._lock:
+                self._bytes -= size
+                self._stats["evictions"] += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["disk_bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB * 1024 * 1024)
+_client = None
+_inflight = {}  # 缓存键 -> 正在进行的下载任务，同一图片的并发请求共享一次下载
+_thumbnail_pool = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            proxy=IMAGE_PROXY_UPSTREAM or None,
+            timeout=IMAGE_PROXY_TIMEOUT,
+            follow_redirects=True,
+        )
+    return _client
+
+
+def _is_fresh(meta):
+    return meta is not None and time.time() - meta["fetched_at"] <= IMAGE_CACHE_FRESH_SECONDS
+
+
+async def _fetch(url, key):
+    """下载图片到缓存；已有过期的缓存时做条件请求，源站不可用时继续使用过期的缓存"""
+    meta = image_cache.load(key)
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    tmp_path = f"{image_cache.body_path(key)}.{uuid.uuid4().hex}.tmp"
     try:
-        # 确保使用正确的代理配置
-        proxies = {
-            "http": "http://localhost:7897",
-            "https": "http://localhost:7897"
-        }
-        
-        # 添加超时设置，避免请求卡住
-        response = requests.get(url, proxies=proxies, timeout=10)
-        
-        # 检查响应状态
-        response.raise_for_status()
-        
-        return Response(
-            content=response.content,
-            media_type=response.headers.get("content-type", "image/jpeg"),
-            headers={"Cache-Control": "max-age=3600"}  # 添加缓存控制
+        async with get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and meta is not None:
+                meta["fetched_at"] = time.time()
+                await asyncio.to_thread(image_cache.save_meta, key, meta)
+                image_cache.count("revalidated")
+                return meta
+            response.raise_for_status()
+            if int(response.headers.get("content-length") or 0) > IMAGE_MAX_BYTES:
+                raise ImageTooLargeError(url)
+
+            # 边下载边写入临时文件，不在内存中缓冲整张图片
+            size = 0
+            f = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ImageTooLargeError(url)
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+
+            new_meta = {
+                "url": url,
+                "content_type": response.headers.get("content-type", "image/jpeg"),
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "fetched_at": time.time(),
+                "size": size,
+                "version": uuid.uuid4().hex,  # 内容更新后旧的缩略图不再使用
+            }
+            await asyncio.to_thread(image_cache.store, key, tmp_path, new_meta)
+            image_cache.count("fetched_bytes", size)
+            return new_meta
+    except ImageTooLargeError:
+        image_cache.count("too_large")
+        raise
+    except (httpx.HTTPError, OSError) as e:
+        if meta is None:
+            image_cache.count("errors")
+            raise
+        print(f"图片源站请求失败，使用过期的缓存: {str(e)}")
+        image_cache.count("stale_served")
+        return meta
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def _shared(key, func):
+    """同一缓存键同时只执行一次 func，其他请求等待同一结果"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(func())
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _inflight.pop(key) if _inflight.get(key) is done else None)
+    else:
+        image_cache.count("coalesced")
+    # shield：某个请求断开时不取消其他请求共享的下载
+    return await asyncio.shield(task)
+
+
+async def get_image(url):
+    """返回 (缓存键, 元数据)：新鲜的缓存直接使用，否则下载或验证，同一图片同时只下载一次"""
+    key = image_cache.key_for(url)
+    meta = await asyncio.to_thread(image_cache.load, key)
+    if _is_fresh(meta):
+        image_cache.count("hits")
+        return key, meta
+    if key not in _inflight:
+        image_cache.count("misses")
+    return key, await _shared(key, lambda: _fetch(url, key))
+
+
+def make_thumbnail(source_path, target_path, size, image_format):
+    """在工作进程中执行：把图片居中裁剪为正方形并缩小到 size（不放大），保存为 WEBP 或 JPEG，返回文件大小"""
+    Image.MAX_IMAGE_PIXELS = THUMBNAIL_MAX_PIXELS
+    with Image.open(source_path) as img:
+        # JPEG 解码时直接按比例缩小，大图只需解码一小部分像素
+        img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img)
+        side = min(size, img.width, img.height)
+        img = ImageOps.fit(img, (side, side), Image.LANCZOS)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if image_format == "WEBP":
+            img.convert("RGBA" if has_alpha else "RGB").save(target_path, "WEBP", quality=80, method=4)
+        else:
+            if has_alpha:
+                # JPEG 不支持透明通道，铺白色背景
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            img.convert("RGB").save(target_path, "JPEG", quality=85, optimize=True, progressive=True)
+    return os.path.getsize(target_path)
+
+
+def get_thumbnail_pool():
+    global _thumbnail_pool
+    if _thumbnail_pool is None:
+        # 缩放和编码是 CPU 密集的，放在独立进程中，不占用事件循环和 GIL
+        _thumbnail_pool = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn")
         )
-    except Exception as e:
-        print(f"代理请求失败: {str(e)}")
-        return Response(status_code=404)
\ No newline at end of file
+    return _thumbnail_pool
+
+
+async def _generate_thumbnail(key, thumbnail_key, size, image_format, source_version):
+    global _thumbnail_pool
+    tmp_path = f"{image_cache.body_path(thumbnail_key)}.{uuid.uuid4().hex}.tmp"
+    try:
+        start = time.perf_counter()
+        pool = get_thumbnail_pool()
+        try:
+            thumbnail_size = await asyncio.get_running_loop().run_in_executor(
+                pool, make_thumbnail, image_cache.body_path(key), tmp_path, size, image_format
+            )
+        except BrokenProcessPool:
+            # 工作进程异常退出后进程池不可再用，下次请求重新创建
+            if _thumbnail_pool is pool:
+                _thumbnail_pool = None
+            raise
+        meta = {
+            "content_type": "image/webp" if image_format == "WEBP" else "image/jpeg",
+            "fetched_at": time.time(),
+            "size": thumbnail_size,
+            "source_version": source_version,
+        }
+        await asyncio.to_thread(image_cache.store, thumbnail_key, tmp_path, meta)
+        image_cache.count("thumbnails_generated")
+        image_cache.count("thumbnail_seconds", time.perf_counter() - start)
+        return meta
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def get_thumbnail(url, size, image_format):
+    """返回 (缓存键, 元数据)：原图未变化时使用已缓存的缩略图，否则在进程池中生成"""
+    key, meta = await get_image(url)
+    source_version = meta.get("version", "")
+    thumbnail_key = image_cache.key_for(f"{url}#{size}.{image_format}")
+    thumbnail_meta = await asyncio.to_thread(image_cache.load, thumbnail_key)
+    if thumbnail_meta is not None and thumbnail_meta.get("source_version") == source_version:
+        image_cache.count("thumbnail_hits")
+        return thumbnail_key, thumbnail_meta
+    return thumbnail_key, await _shared(
+        thumbnail_key, lambda: _generate_thumbnail(key, thumbnail_key, size, image_format, source_version)
+    )
+
+
+def _open_body(key):
+    """打开缓存文件，已被淘汰时返回 None。打开后文件即使被淘汰删除，已打开的句柄仍可读完"""
+    try:
+        return open(image_cache.body_path(key), "rb")
+    except FileNotFoundError:
+        return None
+
+
+async def _iter_file(body):
+    try:
+        while chunk := await asyncio.to_thread(body.read, CHUNK_SIZE):
+            yield chunk
+    finally:
+        body.close()
+
+
+@router.get("/image")
+async def proxy_image(request: Request, url: str = Query(...), size: int | None = None):
+    """代理远程图片；带 size（32/64/128/256）时返回该边长的正方形缩略图，
+    客户端支持时为 WebP，否则为 JPEG"""
+    if not url.startswith(("http://", "https://")) or (size is not None and size not in THUMBNAIL_SIZES):
+        return Response(status_code=400)
+
+    headers = {"Cache-Control": "max-age=3600"}  # 添加缓存控制
+    # 取得缓存条目到打开文件之间可能被 LRU 淘汰：此时重新获取一次
+    for _ in range(2):
+        try:
+            key, meta = await get_image(url)
+        except ImageTooLargeError:
+            print(f"图片超过大小限制: {url}")
+            return Response(status_code=413)
+        except Exception as e:
+            print(f"代理请求失败: {str(e)}")
+            return Response(status_code=404)
+
+        if size is not None and Image is not None:
+            image_format = "WEBP" if "image/webp" in request.headers.get("accept", "") else "JPEG"
+            headers["Vary"] = "Accept"
+            try:
+                key, meta = await get_thumbnail(url, size, image_format)
+            except Exception as e:
+                # 无法识别的图片格式等：返回原图
+                print(f"生成缩略图失败: {str(e)}")
+                image_cache.count("thumbnail_errors")
+
+        body = await asyncio.to_thread(_open_body, key)
+        if body is not None:
+            break
+    else:
+        print(f"缓存文件已被淘汰，重新获取后仍不存在: {url}")
+        return Response(status_code=404)
+
+    headers["Content-Length"] = str(os.fstat(body.fileno()).st_size)
+    return StreamingResponse(_iter_file(body), media_type=meta["content_type"], headers=headers)
+
+
+def get_stats():
+    stats = image_cache.get_stats()
+    stats["in_flight"] = len(_inflight)
+    return stats
@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import Any, List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 import datetime
 from typing import Optional # 导入 Optional
@@ -26,8 +26,9 @@ class User(UserBase):
         from_attributes = True
 
 class UserList(BaseModel):
-    total: int
+    total: Optional[int] = None  # with_total=false 时不统计
     users: List[User]
+    next_cursor: Optional[str] = None
 
 
 class ChatRequest(BaseModel):
@@ -75,6 +76,30 @@ class ChatHistory(ChatHistoryBase):
         from_attributes = True  # 替换 orm_mode = True
 
 
+# 批量查询用户时每种条件最多的个数
+USER_BATCH_MAX = 200
+
+
+class UserBatchRequest(BaseModel):
+    usernames: List[str] = Field(default_factory=list, max_length=USER_BATCH_MAX)
+    ids: List[int] = Field(default_factory=list, max_length=USER_BATCH_MAX)
+
+
+class UserWithID(User):
+    """不可变的用户快照：用户缓存中保存的就是它，可在并发请求间安全共享，不依附任何数据库会话"""
+    id: int
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
+class UserBatch(BaseModel):
+    users: List[UserWithID]
+    missing_usernames: List[str] = []
+    missing_ids: List[int] = []
+
+
 class UsernameRequest(BaseModel):
     username: str
 
@@ -93,6 +118,7 @@ class WritingHistoryCreate(WritingHistoryBase):
 class WritingHistory(WritingHistoryBase):
     id: int
     user_id: int
+    version: int = 1
     # 将类型改为 Optional[datetime.datetime] 以允许 None
     created_at: Optional[datetime.datetime]
     updated_at: Optional[datetime.datetime]
@@ -101,6 +127,97 @@ class WritingHistory(WritingHistoryBase):
         from_attributes = True # Replaces orm_mode=True in Pydantic v2
 
 
+class WritingHistorySummary(BaseModel):
+    """写作历史的元数据，不包含 writing_data 正文；旧记录在运行迁移脚本补全前元数据为 None"""
+    id: int
+    user_id: int
+    title: Optional[str] = None
+    data_size: Optional[int] = None
+    paragraph_count: Optional[int] = None
+    created_at: Optional[datetime.datetime]
+    updated_at: Optional[datetime.datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class WritingPatchOperation(BaseModel):
+    """JSON Patch（RFC 6902）操作，支持 add、remove、replace、test"""
+    op: Literal["add", "remove", "replace", "test"]
+    path: str
+    value: Any = None
+
+
+class WritingHistoryPatch(BaseModel):
+    version: int  # 修改所基于的版本号
+    operations: list[WritingPatchOperation]
+
+
+class WritingHistoryVersion(BaseModel):
+    id: int
+    version: int
+    updated_at: Optional[datetime.datetime]
+
+    class Config:
+        from_attributes = True
+
+
 class WritingHistoryList(BaseModel):
-    total: int
+    total: Optional[int] = None  # with_total=false 时不统计
     writing_histories: list[WritingHistory]
+    next_cursor: Optional[str] = None
+
+
+class ChatMessageBase(BaseModel):
+    role: str
+    content: str
+
+
+class ChatMessageCreate(ChatMessageBase):
+    pass
+
+
+class ChatMessage(ChatMessageBase):
+    seq: int
+    created_at: Optional[datetime.datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class ChatMessagesAppend(BaseModel):
+    conversation_id: int = 0  # 0 表示默认会话
+    messages: List[ChatMessageCreate]
+
+
+class ChatMessagesAppendResponse(BaseModel):
+    conversation_id: int
+    last_seq: int
+
+
+class ChatMessagePage(BaseModel):
+    conversation_id: int
+    messages: List[ChatMessage]
+    next_seq: int  # 下一页请求的 after_seq
+    prev_seq: int  # 更早一页请求的 before_seq
+    has_more: bool  # 按请求方向是否还有更多消息
+
+
+class ConversationCreate(BaseModel):
+    title: str = ""
+
+
+class Conversation(BaseModel):
+    id: int
+    title: Optional[str]
+    message_count: Optional[int]
+    created_at: Optional[datetime.datetime]
+    updated_at: Optional[datetime.datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class ConversationList(BaseModel):
+    conversations: List[Conversation]
+    next_cursor: Optional[str] = None  # 下一页请求的 cursor，没有更多时为 None
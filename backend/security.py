@@ -1,7 +1,50 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt 计算代价；修改后旧密码哈希在用户下次登录时自动按新代价重新计算
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 哈希计算的线程数和排队上限，bcrypt 计算时释放 GIL，可以在线程中并行
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashBusyError(Exception):
+    """等待计算的密码哈希过多"""
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+_pending_lock = threading.Lock()
+_stats = {"completed": 0, "rejected": 0, "rehashed": 0}
+
+
+async def _run(func, *args):
+    """在专用线程池中计算，不阻塞事件循环；排队数超过上限时抛出 PasswordHashBusyError"""
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+            _stats["rejected"] += 1
+            raise PasswordHashBusyError("登录请求过多，请稍后重试")
+        _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+            _stats["completed"] += 1
 
 
 def verify_password(plain_password, hashed_password):
@@ -10,3 +53,21 @@ def verify_password(plain_password, hashed_password):
 
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+
+async def hash_password(password):
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_and_update_password(plain_password, hashed_password):
+    """校验密码，返回 (是否正确, 新哈希)；哈希的计算代价与当前配置不同时新哈希不为 None"""
+    valid, new_hash = await _run(pwd_context.verify_and_update, plain_password, hashed_password)
+    if new_hash:
+        with _pending_lock:
+            _stats["rehashed"] += 1
+    return valid, new_hash
+
+
+def get_stats():
+    with _pending_lock:
+        return {"workers": PASSWORD_HASH_WORKERS, "pending": _pending, "rounds": BCRYPT_ROUNDS, **_stats}
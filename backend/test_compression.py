@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, insert, select, text
+
+import compression
+from compression import CompressedText, compress_text, decompress_text, is_compressed
+
+LARGE_TEXT = '{"passages": [' + ", ".join(f'{{"passage": "第{i}段内容，检索增强的论文写作"}}' for i in range(200)) + "]}"
+
+
+@pytest.fixture(params=["zlib", "zstd"])
+def algorithm(request, monkeypatch):
+    if request.param == "zstd" and compression.zstandard is None:
+        pytest.skip("未安装 zstandard")
+    monkeypatch.setattr(compression, "COMPRESSION_ALGORITHM", request.param)
+    return request.param
+
+
+def test_round_trip_compressed(algorithm):
+    stored = compress_text(LARGE_TEXT)
+    assert stored.startswith(compression.MARKERS[algorithm])
+    assert is_compressed(stored)
+    assert len(stored) < len(LARGE_TEXT.encode("utf-8"))
+    assert decompress_text(stored) == LARGE_TEXT
+
+
+def test_below_threshold_stored_plain(algorithm):
+    value = '{"passages": []}'
+    stored = compress_text(value, threshold=1024)
+    assert stored == value
+    assert not is_compressed(stored)
+    assert decompress_text(stored) == value
+
+
+def test_incompressible_stored_plain(algorithm):
+    # 压缩后不比原文小时原样存储
+    value = "abcdefgh"
+    assert compress_text(value, threshold=1) == value
+
+
+def test_raw_marker_for_dollar_prefix(algorithm):
+    for value in ["$zlib$not really compressed", "$zstd$abc", "$raw$abc", "$5 每篇"]:
+        stored = compress_text(value, threshold=1024)
+        assert stored == compression.RAW_MARKER + value
+        assert not is_compressed(stored)
+        assert decompress_text(stored) == value
+
+
+def test_compression_disabled_still_reads(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_ALGORITHM", "zlib")
+    stored = compress_text(LARGE_TEXT)
+    monkeypatch.setattr(compression, "COMPRESSION_ALGORITHM", "none")
+    assert compress_text(LARGE_TEXT) == LARGE_TEXT
+    assert decompress_text(stored) == LARGE_TEXT
+
+
+def test_legacy_and_none_values():
+    assert compress_text(None) is None
+    assert decompress_text(None) is None
+    assert decompress_text("旧的未压缩数据") == "旧的未压缩数据"
+    assert decompress_text("") == ""
+
+
+def test_compressed_text_column(algorithm):
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    table = Table("histories", metadata, Column("id", Integer, primary_key=True), Column("data", CompressedText))
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(table), [
+            {"id": 1, "data": LARGE_TEXT},
+            {"id": 2, "data": "short"},
+            {"id": 3, "data": "$dollar"},
+            {"id": 4, "data": None},
+        ])
+        raw = dict(connection.execute(text("SELECT id, data FROM histories")).all())
+        values = dict(connection.execute(select(table.c.id, table.c.data)).all())
+    assert raw[1].startswith(compression.MARKERS[algorithm])
+    assert raw[2] == "short"
+    assert raw[3] == "$raw$$dollar"
+    assert values == {1: LARGE_TEXT, 2: "short", 3: "$dollar", 4: None}
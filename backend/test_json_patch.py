@@ -0,0 +1,132 @@
+import copy
+
+import pytest
+
+from json_patch import JsonPatchError, apply_patch
+
+
+def test_add_object_member():
+    assert apply_patch({"foo": "bar"}, [{"op": "add", "path": "/baz", "value": "qux"}]) == {"foo": "bar", "baz": "qux"}
+
+
+def test_add_array_element():
+    document = {"foo": ["bar", "baz"]}
+    assert apply_patch(document, [{"op": "add", "path": "/foo/1", "value": "qux"}]) == {"foo": ["bar", "qux", "baz"]}
+
+
+def test_add_to_end_with_dash():
+    document = {"passages": [{"passage": "a"}]}
+    result = apply_patch(document, [{"op": "add", "path": "/passages/-", "value": {"passage": "b"}}])
+    assert result == {"passages": [{"passage": "a"}, {"passage": "b"}]}
+
+
+def test_dash_only_allowed_for_add():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": [1]}, [{"op": "remove", "path": "/foo/-"}])
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": [1]}, [{"op": "replace", "path": "/foo/-", "value": 2}])
+
+
+def test_remove():
+    assert apply_patch({"baz": "qux", "foo": "bar"}, [{"op": "remove", "path": "/baz"}]) == {"foo": "bar"}
+    assert apply_patch({"foo": ["bar", "qux", "baz"]}, [{"op": "remove", "path": "/foo/1"}]) == {"foo": ["bar", "baz"]}
+
+
+def test_remove_missing_member():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": "bar"}, [{"op": "remove", "path": "/baz"}])
+
+
+def test_replace():
+    document = {"baz": "qux", "foo": ["a", "b"]}
+    result = apply_patch(document, [
+        {"op": "replace", "path": "/baz", "value": "boo"},
+        {"op": "replace", "path": "/foo/0", "value": "c"},
+    ])
+    assert result == {"baz": "boo", "foo": ["c", "b"]}
+
+
+def test_replace_missing_member_or_index():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": "bar"}, [{"op": "replace", "path": "/baz", "value": 1}])
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": ["bar"]}, [{"op": "replace", "path": "/foo/1", "value": 1}])
+
+
+def test_replace_whole_document():
+    assert apply_patch({"foo": "bar"}, [{"op": "replace", "path": "", "value": [1]}]) == [1]
+
+
+def test_test_passes():
+    document = {"baz": "qux", "foo": ["a", 2, "c"]}
+    assert apply_patch(document, [
+        {"op": "test", "path": "/baz", "value": "qux"},
+        {"op": "test", "path": "/foo/1", "value": 2},
+    ]) == {"baz": "qux", "foo": ["a", 2, "c"]}
+
+
+def test_failed_test_operation():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"baz": "qux"}, [{"op": "test", "path": "/baz", "value": "bar"}])
+
+
+def test_failed_test_stops_later_operations():
+    # 调用方在失败时丢弃文档，但 test 之后的操作不应再执行
+    document = {"a": 1}
+    with pytest.raises(JsonPatchError):
+        apply_patch(document, [
+            {"op": "test", "path": "/a", "value": 2},
+            {"op": "add", "path": "/b", "value": 3},
+        ])
+    assert document == {"a": 1}
+
+
+def test_leading_zero_index_rejected():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": ["a", "b"]}, [{"op": "replace", "path": "/foo/01", "value": "c"}])
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": ["a", "b"]}, [{"op": "add", "path": "/foo/00", "value": "c"}])
+    assert apply_patch({"foo": ["a"]}, [{"op": "replace", "path": "/foo/0", "value": "b"}]) == {"foo": ["b"]}
+
+
+def test_index_out_of_range():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": ["a"]}, [{"op": "add", "path": "/foo/2", "value": "b"}])
+    assert apply_patch({"foo": ["a"]}, [{"op": "add", "path": "/foo/1", "value": "b"}]) == {"foo": ["a", "b"]}
+
+
+def test_escaped_pointer_tokens():
+    document = {"a/b": 1, "m~n": 2}
+    result = apply_patch(document, [
+        {"op": "replace", "path": "/a~1b", "value": 3},
+        {"op": "replace", "path": "/m~0n", "value": 4},
+    ])
+    assert result == {"a/b": 3, "m~n": 4}
+
+
+def test_nested_missing_parent():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": {}}, [{"op": "add", "path": "/bar/baz", "value": 1}])
+
+
+def test_unsupported_operation():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": 1}, [{"op": "move", "from": "/foo", "path": "/bar"}])
+
+
+def test_invalid_pointer():
+    with pytest.raises(JsonPatchError):
+        apply_patch({"foo": 1}, [{"op": "remove", "path": "foo"}])
+
+
+def test_writing_document_paragraph_edit():
+    document = {"title": "综述", "passages": [{"passage_type": "引言", "passage": "旧内容"}]}
+    original = copy.deepcopy(document)
+    result = apply_patch(copy.deepcopy(document), [
+        {"op": "test", "path": "/passages/0/passage", "value": "旧内容"},
+        {"op": "replace", "path": "/passages/0/passage", "value": "新内容"},
+        {"op": "add", "path": "/passages/-", "value": {"passage_type": "结论", "passage": ""}},
+    ])
+    assert result["passages"][0]["passage"] == "新内容"
+    assert len(result["passages"]) == 2
+    assert document == original
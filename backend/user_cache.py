@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """按用户名缓存已认证用户：短TTL、容量上限的LRU，用户更新或删除时失效
+
+    缓存的对象在并发请求间共享，只应存放不可变快照（schemas.UserWithID），不存放绑定会话的 ORM 对象。
+    """
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # username -> (写入时间, user)
+        self._versions = {}  # username -> 失效次数，防止并发查询把失效前的旧数据写回缓存
+        self._epoch = 0  # 清空版本表时递增
+        self._generation = 0  # 任意用户失效时递增，用于查询前还不知道用户名的情况（按 id 查询）
+        self._ids = {}  # user id -> username，按 id 查找缓存
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(username)
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                self._drop(username)
+            self._stats["misses"] += 1
+            return None
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            username = self._ids.get(user_id)
+            if username is None:
+                self._stats["misses"] += 1
+                return None
+        user = self.get(username)
+        return user if user is not None and user.id == user_id else None
+
+    def generation(self):
+        """按 id 查询数据库前取得，写回缓存时期间没有任何用户失效才生效"""
+        with self._lock:
+            return self._generation
+
+    def version(self, username):
+        """查询数据库前取得版本号，写回缓存时版本未变才生效"""
+        with self._lock:
+            return self._epoch, self._versions.get(username, 0)
+
+    def set(self, username, user, version, generation=None):
+        with self._lock:
+            if (self._epoch, self._versions.get(username, 0)) != version:
+                return
+            if generation is not None and generation != self._generation:
+                return
+            self._drop(username)
+            self._entries[username] = (time.monotonic(), user)
+            self._ids[user.id] = username
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _drop(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None and self._ids.get(entry[1].id) == username:
+            del self._ids[entry[1].id]
+
+    def invalidate(self, *usernames):
+        with self._lock:
+            self._generation += 1
+            for username in usernames:
+                self._drop(username)
+                self._versions[username] = self._versions.get(username, 0) + 1
+                self._stats["invalidations"] += 1
+            # 版本号只需覆盖可能仍在进行的查询，数量过多时清空
+            if len(self._versions) > self.max_entries * 4:
+                self._versions.clear()
+                self._epoch += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# 多个进程部署时各自缓存，用户变更在其他进程中最多延迟 USER_CACHE_TTL 秒生效
+user_cache = UserCache(
+    max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
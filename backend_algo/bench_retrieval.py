@@ -0,0 +1,171 @@
+"""
+检索效果对比：用 datas/questions_q_a_r_ref.json 中每个问题的段落关键词检索向量数据库，
+分别按混合检索（BM25 + 倒数排名融合）和仅向量检索得到参考论文排序，
+以参考答案中的 R 字段计算 Precision@K、Recall@K、F1@K，并统计检索耗时。
+
+只评测检索阶段（与 RETRIEVAL_MODE 切换的部分一致），不经过多样化、重排序和大模型，
+结果不受生成内容的影响。需要先启动向量数据库和 embedding 服务。
+
+用法：python bench_retrieval.py [--ref ../datas/questions_q_a_r_ref.json] [--n-results 20] [--output retrieval_eval.json]
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import time
+
+import pdf_to_vectordb
+import retrieval
+
+MODES = ("dense", "hybrid")
+K_VALUES = [1, 3, 5, 8, 10]
+DEFAULT_REF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datas", "questions_q_a_r_ref.json")
+
+
+def parse_field(value):
+    """Q、R 字段可能是列表，也可能是列表的字符串形式"""
+    if isinstance(value, str):
+        return ast.literal_eval(value)
+    return value
+
+
+def load_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    questions = []
+    for item in data:
+        # 部分问题没有参考文献，无法评测
+        if not item.get("R"):
+            continue
+        questions.append({
+            "id": item.get("id"),
+            "passages": parse_field(item["Q"]),
+            "references": list(dict.fromkeys(parse_field(item["R"]))),
+        })
+    return questions
+
+
+def retrieve_sources(query, mode, n_results):
+    """返回 (按相关度排序且去重的来源列表, 耗时ms)，检索方式与 /writing/ 相同"""
+    start = time.perf_counter()
+    results = pdf_to_vectordb.collection.query(
+        query_texts=[query],
+        n_results=n_results,
+        include=["documents", "metadatas"],
+    )
+    if mode == "hybrid":
+        keyword_hits = pdf_to_vectordb.keyword_index.search(query, n_results)
+        _, _, metadatas, _ = retrieval.fuse_dense_and_keyword(
+            results, keyword_hits, pdf_to_vectordb.keyword_index, n_results=n_results
+        )
+    else:
+        metadatas = results.get("metadatas", [[]])[0]
+    elapsed = (time.perf_counter() - start) * 1000
+    sources = [(metadata or {}).get("source", "Unknown") for metadata in metadatas]
+    return list(dict.fromkeys(sources)), elapsed
+
+
+def merge_rankings(rankings):
+    """合并一个问题各段落的来源排序：按在各段落中的最好名次排序，名次相同时先出现的段落优先"""
+    best = {}
+    for passage_index, ranking in enumerate(rankings):
+        for rank, source in enumerate(ranking):
+            key = (rank, passage_index)
+            if source not in best or key < best[source]:
+                best[source] = key
+    return sorted(best, key=lambda source: best[source])
+
+
+def precision_at_k(predicted, actual, k):
+    predicted_k = predicted[:k]
+    if not predicted_k:
+        return 0.0
+    return len(set(predicted_k) & set(actual)) / len(predicted_k)
+
+
+def recall_at_k(predicted, actual, k=None):
+    if not actual:
+        return 0.0
+    predicted_k = predicted if k is None else predicted[:k]
+    return len(set(predicted_k) & set(actual)) / len(actual)
+
+
+def f1_at_k(predicted, actual, k):
+    precision = precision_at_k(predicted, actual, k)
+    recall = recall_at_k(predicted, actual, k)
+    if precision + recall == 0:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def evaluate(questions, mode, n_results):
+    rankings = []
+    timings = []
+    for question in questions:
+        passage_rankings = []
+        for passage in question["passages"]:
+            query = " ".join(passage[1])
+            sources, elapsed = retrieve_sources(query, mode, n_results)
+            passage_rankings.append(sources)
+            timings.append(elapsed)
+        rankings.append(merge_rankings(passage_rankings))
+
+    metrics = {}
+    for k in K_VALUES:
+        metrics[f"K={k}"] = {
+            "Precision@K": statistics.mean(precision_at_k(r, q["references"], k) for r, q in zip(rankings, questions)),
+            "Recall@K": statistics.mean(recall_at_k(r, q["references"], k) for r, q in zip(rankings, questions)),
+            "F1@K": statistics.mean(f1_at_k(r, q["references"], k) for r, q in zip(rankings, questions)),
+        }
+    timings.sort()
+    return {
+        "metrics": metrics,
+        # 候选池召回率：送入后处理的全部候选中覆盖了多少参考论文
+        "pool_recall": statistics.mean(recall_at_k(r, q["references"]) for r, q in zip(rankings, questions)),
+        "latency_ms": {
+            "mean": statistics.mean(timings),
+            "p95": timings[max(int(len(timings) * 0.95) - 1, 0)],
+        },
+        "rankings": {q["id"]: r for r, q in zip(rankings, questions)},
+    }
+
+
+def print_comparison(results):
+    print(f"{'指标':<20}" + "".join(f"{mode:>10}" for mode in MODES) + f"{'差值':>10}")
+    rows = [(f"{name}(K={k})", lambda result, k=k, name=name: result["metrics"][f"K={k}"][name])
+            for k in K_VALUES for name in ("Precision@K", "Recall@K", "F1@K")]
+    rows.append(("候选池召回率", lambda result: result["pool_recall"]))
+    for label, getter in rows:
+        values = [getter(results[mode]) for mode in MODES]
+        print(f"{label:<20}" + "".join(f"{value:>10.4f}" for value in values) + f"{values[1] - values[0]:>+10.4f}")
+    for stat in ("mean", "p95"):
+        values = [results[mode]["latency_ms"][stat] for mode in MODES]
+        print(f"{'检索耗时ms(' + stat + ')':<20}" + "".join(f"{value:>10.1f}" for value in values)
+              + f"{values[1] - values[0]:>+10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ref", default=DEFAULT_REF)
+    parser.add_argument("--n-results", type=int, default=20)
+    parser.add_argument("--output", default=None, help="把逐题排序和汇总指标保存为JSON")
+    args = parser.parse_args()
+
+    questions = load_questions(args.ref)
+    print(f"有参考文献的问题数: {len(questions)}，段落查询数: {sum(len(q['passages']) for q in questions)}")
+    pdf_to_vectordb.load_keyword_index_from_collection()
+
+    results = {mode: evaluate(questions, mode, args.n_results) for mode in MODES}
+    print_comparison(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"questions": len(questions), "n_results": args.n_results, "results": results},
+                      f, ensure_ascii=False, indent=4)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
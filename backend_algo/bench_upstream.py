@@ -0,0 +1,98 @@
+"""
+上游负载均衡压测：在本地启动若干模拟大模型服务的桩服务器，
+测量节点数从1增加到N时的吞吐量，并验证节点故障时的熔断与换节点重试。
+
+用法：python bench_upstream.py --nodes 4 --requests 200 --clients 16
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import upstream
+
+
+def start_stub_server(latency, capacity):
+    """启动一个桩服务器：每个节点同时只能处理 capacity 个请求，每个请求耗时 latency 秒"""
+    slots = threading.Semaphore(capacity)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with slots:
+                time.sleep(latency)
+            body = json.dumps({"choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def unused_port_url():
+    """返回一个没有服务监听的地址，模拟宕机节点"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def run_load(pool, total_requests, clients):
+    def call(_):
+        response = pool.post("/chat/completions", json={"messages": []}, timeout=10)
+        return response.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(call, range(total_requests)))
+    elapsed = time.perf_counter() - start
+    return sum(results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--capacity", type=int, default=2)
+    args = parser.parse_args()
+
+    servers = [start_stub_server(args.latency, args.capacity) for _ in range(args.nodes)]
+    urls = [url for _, url in servers]
+
+    print("吞吐量随节点数的变化:")
+    print(f"{'节点数':<8} {'成功数':<8} {'耗时(s)':<10} {'吞吐(req/s)':<12}")
+    baseline = None
+    for count in range(1, args.nodes + 1):
+        pool = upstream.UpstreamPool(urls[:count], name=f"bench-{count}")
+        ok, elapsed = run_load(pool, args.requests, args.clients)
+        throughput = ok / elapsed
+        baseline = baseline or throughput
+        print(f"{count:<8} {ok:<8} {elapsed:<10.2f} {throughput:<12.1f} (x{throughput / baseline:.2f})")
+
+    print("\n故障节点测试（加入一个宕机节点）:")
+    pool = upstream.UpstreamPool(urls + [unused_port_url()], name="bench-failover", cooldown=60)
+    ok, elapsed = run_load(pool, args.requests, args.clients)
+    print(f"成功 {ok}/{args.requests}，耗时 {elapsed:.2f}s")
+    for stats in pool.get_stats():
+        print(f"  {stats}")
+
+    for server, _ in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
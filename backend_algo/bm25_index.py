@@ -0,0 +1,106 @@
+import math
+import re
+import threading
+from collections import Counter
+
+import jieba
+
+# 只保留包含字母、数字或汉字的词
+_TOKEN_PATTERN = re.compile(r"\w", re.UNICODE)
+
+
+def tokenize(text):
+    """使用jieba分词（搜索引擎模式），统一小写并过滤标点和空白"""
+    if not text:
+        return []
+    return [
+        token.lower()
+        for token in jieba.lcut_for_search(text)
+        if token.strip() and _TOKEN_PATTERN.search(token)
+    ]
+
+
+class BM25Index:
+    """进程内倒排索引，支持增量添加文档并按BM25打分检索"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents = {}  # id -> (document, metadata, 文档长度, 词集合)
+        self._postings = {}  # term -> {id: 词频}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, ids, documents, metadatas=None):
+        """增量添加文档，已存在的id会被覆盖"""
+        if metadatas is None:
+            metadatas = [{} for _ in ids]
+        tokenized = [Counter(tokenize(doc)) for doc in documents]
+        with self._lock:
+            for doc_id, document, metadata, term_freqs in zip(ids, documents, metadatas, tokenized):
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+                length = sum(term_freqs.values())
+                self._documents[doc_id] = (document, metadata, length, tuple(term_freqs))
+                self._total_length += length
+                for term, freq in term_freqs.items():
+                    self._postings.setdefault(term, {})[doc_id] = freq
+
+    def remove(self, ids):
+        """从索引中删除文档"""
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        _, _, length, terms = self._documents.pop(doc_id)
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._documents.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def get(self, ids):
+        """按id取回文档和元数据，返回 (documents, metadatas)"""
+        with self._lock:
+            entries = [self._documents.get(doc_id) for doc_id in ids]
+        documents = [entry[0] if entry else None for entry in entries]
+        metadatas = [entry[1] if entry else None for entry in entries]
+        return documents, metadatas
+
+    def search(self, query, n_results=20):
+        """返回按BM25分数降序排列的 [(id, score), ...]"""
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count = len(self._documents)
+            if doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count
+            scores = {}
+            for term, query_freq in terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, freq in postings.items():
+                    length = self._documents[doc_id][2]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + query_freq * idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
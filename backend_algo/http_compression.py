@@ -0,0 +1,26 @@
+import os
+
+from starlette.middleware.gzip import GZipMiddleware
+
+# 小于该字节数的响应不压缩
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1000"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+
+# 不压缩的路径：GZipMiddleware 会把流式响应攒进压缩缓冲区而不刷新，推迟聊天流的逐块输出；
+# 静态文件是已编译的 PDF，压缩收益低
+UNCOMPRESSED_PATHS = ("/chat/stream/", "/static/")
+
+
+class CompressionMiddleware:
+    """使用 Starlette 自带的 GZipMiddleware 压缩 JSON 等响应，流式聊天和静态文件原样返回"""
+
+    def __init__(self, app, exclude_paths=UNCOMPRESSED_PATHS):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE, compresslevel=RESPONSE_GZIP_LEVEL)
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.exclude_paths):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+
+from scheduler import QueueFullError
+
+# 编译时的固定文件名，使 .aux 等中间文件在同一文档的多次编译间可以复用
+DOCUMENT_NAME = "document"
+# 交叉引用、目录等依赖的中间文件，内容不再变化即认为编译已收敛
+AUXILIARY_EXTENSIONS = (".aux", ".toc", ".out", ".lof", ".lot")
+
+
+class CompileJob:
+    def __init__(self, job_id, tex_path, pdf_path, build_key):
+        self.id = job_id
+        self.tex_path = tex_path
+        self.pdf_path = pdf_path
+        self.build_key = build_key
+        self.status = "queued"  # queued / running / done / failed
+        self.error = ""
+        self.pass_seconds = []  # 每遍 xelatex 的耗时
+        self.used_format = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "queue_seconds": (self.started_at or time.time()) - self.created_at,
+            "compile_seconds": (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0,
+            "pass_seconds": list(self.pass_seconds),
+            "used_format": self.used_format,
+        }
+
+
+class LatexCompiler:
+    """LaTeX 编译服务：固定数量的工作协程各自用 asyncio 子进程运行 xelatex，任务排队并记录状态。
+
+    每个文档有持久的构建目录，保留上次编译的 .aux 等文件；xelatex 反复运行直到中间文件不再变化
+    （最多 max_passes 遍），文档结构未变时一遍即可完成。可选地把导言区预编译为格式文件复用。
+    """
+
+    def __init__(self, workers=2, max_queue=32, timeout=30, max_jobs=256,
+                 build_dir="cache/latex_build", max_build_dirs=64, max_passes=4, precompile_preamble=False):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.build_dir = build_dir
+        self.max_build_dirs = max_build_dirs
+        self.max_passes = max_passes
+        self.precompile_preamble = precompile_preamble
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._worker_tasks = []
+        self._build_locks = {}  # 同一构建目录同时只能有一个编译
+        self._format_locks = {}
+        self._failed_formats = set()  # 无法预编译的导言区，之后直接完整编译
+        self._stats = {"passes": 0, "converged": 0, "not_converged": 0, "format_builds": 0, "format_failures": 0}
+        os.makedirs(os.path.join(build_dir, "formats"), exist_ok=True)
+
+    def _ensure_workers(self):
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, tex_path, pdf_path, build_key=None):
+        """提交编译任务，队列已满时抛出 QueueFullError；build_key 相同的任务共用构建目录"""
+        self._ensure_workers()
+        if not build_key:
+            build_key = os.path.splitext(os.path.basename(tex_path))[0]
+        job = CompileJob(str(uuid.uuid4()), tex_path, pdf_path, build_key)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("LaTeX 编译队列已满，请稍后重试")
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                lock = self._build_locks.setdefault(job.build_key, asyncio.Lock())
+                async with lock:
+                    await self._compile(job)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                print(f"PDF 编译失败: {str(e)}")
+            finally:
+                job.finished_at = time.time()
+                job.done.set()
+                self._queue.task_done()
+                protected = {key for key, lock in self._build_locks.items() if lock.locked()}
+                for key in await asyncio.to_thread(self._prune_build_dirs, protected):
+                    self._build_locks.pop(key, None)
+
+    async def _compile(self, job):
+        build_path = os.path.join(self.build_dir, job.build_key)
+        os.makedirs(build_path, exist_ok=True)
+        os.utime(build_path)  # 目录的修改时间用于淘汰最久未使用的构建目录
+        source_path = os.path.join(build_path, DOCUMENT_NAME + ".tex")
+        await asyncio.to_thread(shutil.copyfile, job.tex_path, source_path)
+
+        format_name = None
+        if self.precompile_preamble:
+            format_name = await self._ensure_format(source_path)
+
+        previous = _auxiliary_digest(build_path)
+        for number in range(1, self.max_passes + 1):
+            start = time.perf_counter()
+            returncode = await self._run_xelatex(build_path, format_name)
+            if returncode != 0 and format_name and number == 1:
+                # 预编译格式可能与当前导言区不兼容：改为完整编译，完整编译成功时不再使用该格式
+                print("使用预编译导言区编译失败，改为完整编译")
+                returncode = await self._run_xelatex(build_path, None)
+                if returncode == 0:
+                    self._failed_formats.add(format_name)
+                format_name = None
+            elapsed = time.perf_counter() - start
+            job.pass_seconds.append(elapsed)
+            self._stats["passes"] += 1
+            print(f"xelatex 第{number}遍 ({job.build_key[:8]}): {elapsed:.2f}秒")
+
+            current = _auxiliary_digest(build_path)
+            if current == previous:
+                self._stats["converged"] += 1
+                break
+            previous = current
+        else:
+            self._stats["not_converged"] += 1
+            print(f"xelatex 运行 {self.max_passes} 遍后中间文件仍在变化 ({job.build_key[:8]})")
+        job.used_format = format_name is not None
+
+        built_pdf_path = os.path.join(build_path, DOCUMENT_NAME + ".pdf")
+        if not os.path.exists(built_pdf_path):
+            raise RuntimeError(f"xelatex 未生成 PDF（退出码 {returncode}）")
+        # 同一文件系统时直接重命名，否则分块流式复制，不把整个 PDF 读入内存
+        await asyncio.to_thread(shutil.move, built_pdf_path, job.pdf_path)
+
+    async def _run_xelatex(self, build_path, format_name):
+        command = ["xelatex", "-interaction=nonstopmode"]
+        env = None
+        if format_name:
+            command.append(f"-fmt={format_name}")
+            env = dict(os.environ, TEXFORMATS=os.path.abspath(os.path.join(self.build_dir, "formats")) + os.pathsep)
+        command.append(DOCUMENT_NAME + ".tex")
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=build_path,
+            env=env,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            return await asyncio.wait_for(process.wait(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RuntimeError(f"xelatex 编译超时（{self.timeout} 秒）")
+
+    async def _ensure_format(self, source_path):
+        """按导言区内容把 ctex 等宏包预编译为格式文件（mylatexformat），失败时返回 None"""
+        with open(source_path, encoding="utf-8") as f:
+            preamble = f.read().split("\\begin{document}", 1)[0]
+        format_name = "preamble-" + hashlib.sha256(preamble.encode("utf-8")).hexdigest()[:16]
+        if format_name in self._failed_formats:
+            return None
+        formats_path = os.path.join(self.build_dir, "formats")
+        format_path = os.path.join(formats_path, format_name + ".fmt")
+
+        async with self._format_locks.setdefault(format_name, asyncio.Lock()):
+            if os.path.exists(format_path):
+                return format_name
+            with tempfile.TemporaryDirectory() as tmpdir:
+                shutil.copyfile(source_path, os.path.join(tmpdir, DOCUMENT_NAME + ".tex"))
+                process = await asyncio.create_subprocess_exec(
+                    "xelatex", "-ini", "-interaction=nonstopmode", f"-jobname={format_name}",
+                    "&xelatex", "mylatexformat.ltx", DOCUMENT_NAME + ".tex",
+                    cwd=tmpdir,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=self.timeout * 2)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                built_format = os.path.join(tmpdir, format_name + ".fmt")
+                if process.returncode != 0 or not os.path.exists(built_format):
+                    print("导言区预编译失败，使用完整编译")
+                    self._failed_formats.add(format_name)
+                    self._stats["format_failures"] += 1
+                    return None
+                shutil.move(built_format, format_path)
+            self._stats["format_builds"] += 1
+            return format_name
+
+    def _prune_build_dirs(self, protected=()):
+        """构建目录数超过上限时删除最久未使用的，返回被删除的构建键"""
+        entries = []
+        for entry in os.scandir(self.build_dir):
+            if entry.is_dir() and entry.name != "formats":
+                entries.append((entry.stat().st_mtime, entry.name))
+        entries.sort()
+        removed = []
+        for _, key in entries[:max(len(entries) - self.max_build_dirs, 0)]:
+            if key in protected:
+                continue
+            shutil.rmtree(os.path.join(self.build_dir, key), ignore_errors=True)
+            removed.append(key)
+        return removed
+
+    def get_stats(self):
+        statuses = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize(), "jobs": statuses, **self._stats}
+
+
+def _auxiliary_digest(build_path):
+    """中间文件内容的摘要，用于判断是否需要再运行一遍"""
+    digest = hashlib.sha256()
+    for extension in AUXILIARY_EXTENSIONS:
+        path = os.path.join(build_path, DOCUMENT_NAME + extension)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(extension.encode() + f.read())
+    return digest.hexdigest()
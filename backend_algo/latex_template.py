@@ -0,0 +1,207 @@
+import re
+
+import jinja2
+
+# 使用不与 LaTeX 语法冲突的定界符
+_env = jinja2.Environment(
+    block_start_string="((*",
+    block_end_string="*))",
+    variable_start_string="(((",
+    variable_end_string=")))",
+    comment_start_string="((=",
+    comment_end_string="=))",
+    trim_blocks=True,
+    lstrip_blocks=True,
+    autoescape=False,
+    undefined=jinja2.StrictUndefined,
+)
+
+DOCUMENT_TEMPLATE = _env.from_string(r"""\documentclass[a4paper,12pt]{((( document_class )))}
+\usepackage[UTF8]{ctex}
+\usepackage{amsmath,amssymb}
+\usepackage{geometry}
+\usepackage[hidelinks]{hyperref}
+\geometry{margin=2.5cm}
+
+\title{((( title )))}
+\author{((( author )))}
+\date{\today}
+
+\begin{document}
+\maketitle
+((* if table_of_contents *))
+\tableofcontents
+((* endif *))
+
+((* for section in sections *))
+\((( section_command ))){((( section.title )))}
+((( section.body )))
+((* if section.citations *))
+
+本节参考文献：\cite{((( section.citations | join(",") )))}
+((* endif *))
+
+((* endfor *))
+((* if references *))
+\begin{thebibliography}{99}
+((* for reference in references *))
+\bibitem{((( reference.key )))} ((( reference.text )))
+((* endfor *))
+\end{thebibliography}
+((* endif *))
+
+\end{document}
+""")
+
+# template_type -> (文档类, 章节命令, 是否生成目录)
+TEMPLATE_TYPES = {
+    "article": ("article", "section", False),
+    "report": ("report", "chapter", True),
+    "book": ("book", "chapter", True),
+}
+
+_LATEX_SPECIAL = {
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+}
+_SPECIAL_PATTERN = re.compile("|".join(re.escape(char) for char in _LATEX_SPECIAL))
+
+# 行内元素：行内公式原样保留，代码、粗体、斜体转换为对应命令
+_INLINE_PATTERN = re.compile(
+    r"(?P<math>\$[^$\n]+\$)"
+    r"|`(?P<code>[^`\n]+)`"
+    r"|\*\*(?P<bold>[^*\n]+)\*\*"
+    r"|__(?P<bold2>[^_\n]+)__"
+    r"|\*(?P<italic>[^*\n]+)\*"
+)
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+_UNORDERED_PATTERN = re.compile(r"^\s*[-*+]\s+(.*)$")
+_ORDERED_PATTERN = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+_REFERENCE_PREFIX = re.compile(r"^Reference \d+:\s*")
+
+
+def escape_latex(text):
+    return _SPECIAL_PATTERN.sub(lambda match: _LATEX_SPECIAL[match.group()], text)
+
+
+def convert_inline(text):
+    """转换一行 markdown 的行内格式"""
+    result = []
+    position = 0
+    for match in _INLINE_PATTERN.finditer(text):
+        result.append(escape_latex(text[position:match.start()]))
+        if match.group("math"):
+            result.append(match.group("math"))
+        elif match.group("code"):
+            result.append(r"\texttt{" + escape_latex(match.group("code")) + "}")
+        elif match.group("bold") or match.group("bold2"):
+            result.append(r"\textbf{" + escape_latex(match.group("bold") or match.group("bold2")) + "}")
+        else:
+            result.append(r"\emph{" + escape_latex(match.group("italic")) + "}")
+        position = match.end()
+    result.append(escape_latex(text[position:]))
+    return "".join(result)
+
+
+def markdown_to_latex(markdown):
+    """把段落的 markdown（标题、列表、引用、代码块、行内格式）转换为 LaTeX"""
+    output = []
+    list_environment = None
+    in_code = False
+
+    def close_list():
+        nonlocal list_environment
+        if list_environment:
+            output.append(f"\\end{{{list_environment}}}")
+            list_environment = None
+
+    for line in markdown.replace("\r\n", "\n").split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            close_list()
+            output.append(r"\end{verbatim}" if in_code else r"\begin{verbatim}")
+            in_code = not in_code
+            continue
+        if in_code:
+            output.append(line)
+            continue
+        if not stripped:
+            close_list()
+            output.append("")
+            continue
+
+        heading = _HEADING_PATTERN.match(stripped)
+        unordered = _UNORDERED_PATTERN.match(line)
+        ordered = _ORDERED_PATTERN.match(line)
+        if heading:
+            close_list()
+            command = "subsection*" if len(heading.group(1)) <= 2 else "subsubsection*"
+            output.append(f"\\{command}{{{convert_inline(heading.group(2).strip())}}}")
+        elif unordered or ordered:
+            environment = "itemize" if unordered else "enumerate"
+            if list_environment != environment:
+                close_list()
+                output.append(f"\\begin{{{environment}}}")
+                list_environment = environment
+            output.append(r"\item " + convert_inline((unordered or ordered).group(1).strip()))
+        elif stripped.startswith(">"):
+            close_list()
+            output.append(r"\begin{quote}" + convert_inline(stripped.lstrip("> ").strip()) + r"\end{quote}")
+        else:
+            close_list()
+            output.append(convert_inline(stripped))
+    close_list()
+    if in_code:
+        output.append(r"\end{verbatim}")
+    return "\n".join(output).strip()
+
+
+def strip_reference_number(reference):
+    """去掉 /writing/ 返回的 "Reference N: " 前缀，得到来源名称"""
+    return _REFERENCE_PREFIX.sub("", reference).strip()
+
+
+def render_document(request):
+    """把 LatexOutputRequest 渲染为完整、可编译的 LaTeX 文档"""
+    document_class, section_command, table_of_contents = TEMPLATE_TYPES.get(
+        request.template_type, TEMPLATE_TYPES["article"]
+    )
+
+    # 参考文献在各段落间按来源去重，统一编号
+    reference_keys = {}
+    references = []
+    sections = []
+    for passage in request.passages:
+        citations = []
+        for reference in passage.references:
+            source = strip_reference_number(reference)
+            if not source:
+                continue
+            if source not in reference_keys:
+                reference_keys[source] = f"ref{len(reference_keys) + 1}"
+                references.append({"key": reference_keys[source], "text": escape_latex(source)})
+            if reference_keys[source] not in citations:
+                citations.append(reference_keys[source])
+        sections.append({
+            "title": convert_inline(passage.passage_title or passage.passage_type),
+            "body": markdown_to_latex(passage.passage),
+            "citations": citations,
+        })
+
+    return DOCUMENT_TEMPLATE.render(
+        document_class=document_class,
+        section_command=section_command,
+        table_of_contents=table_of_contents,
+        title=convert_inline(request.paper_title),
+        author=convert_inline(request.author_name),
+        sections=sections,
+        references=references,
+    )
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(payload):
+    """用模型、消息和采样参数的规范化JSON计算缓存键"""
+    normalized = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """大模型补全结果缓存：内存LRU + 磁盘存储，均带TTL和容量上限"""
+
+    def __init__(self, directory, max_entries=1024, ttl=86400, max_disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> (写入时间, response)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = None
+        if stored is not None and now - stored["created"] <= self.ttl:
+            # 更新修改时间，磁盘淘汰时按最近使用排序
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            with self._lock:
+                self._remember(key, stored["created"], stored["response"])
+                self._stats["hits"] += 1
+                self._stats["disk_hits"] += 1
+            return stored["response"]
+        if stored is not None:
+            self._remove_file(path)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, response):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, response)
+            self._stats["writes"] += 1
+
+        # 先写临时文件再替换，避免并发读到半个文件
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": created, "response": response}, f, ensure_ascii=False)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += os.path.getsize(path) - previous
+                over_limit = self._disk_bytes > self.max_disk_bytes
+            if over_limit:
+                self._evict_disk()
+        except OSError as e:
+            print(f"写入补全缓存失败: {e}")
+
+    def _remember(self, key, created, response):
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _remove_file(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """磁盘占用超限时先删除过期文件，再按最久未修改的顺序删除，直到降到上限的90%"""
+        now = time.time()
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        target = self.max_disk_bytes * 0.9
+        for entry in entries:
+            expired = now - entry.stat().st_mtime > self.ttl
+            if not expired and self._disk_bytes <= target:
+                break
+            self._remove_file(entry.path)
+            with self._lock:
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                self._remove_file(entry.path)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -1,42 +1,158 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from starlette.concurrency import iterate_in_threadpool
 from fastapi.staticfiles import StaticFiles
 import schemas
 import requests
 import os
-import subprocess
-import tempfile
-import uuid
-from typing import List
 import json
+import base64
+import hashlib
 import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
 from langchain_community.vectorstores import Chroma
 # 假设您已经有了向量数据库的配置
 # 导入pdf_to_vectordb模块中的函数
 import pdf_to_vectordb
+import retrieval
+import prompt_budget
+import llm_cache
+import singleflight
+import scheduler
+import upstream
+import latex_compiler as latex_compiler_module
+import output_store as output_store_module
+import latex_template
+from http_compression import CompressionMiddleware
 import asyncio
+import time
 import threading
 import shutil
 from pathlib import Path
 
-# 配置OpenAI embedding函数
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key="API_KEY_IS_NOT_NEEDED",
-    api_base="http://10.176.64.152:11435/v1",
-    model_name="bge-m3"
-)
+# 与入库共用embedding函数及其上游节点池
+openai_ef = pdf_to_vectordb.openai_ef
 
 app = FastAPI()
+# 压缩 JSON 响应；流式聊天输出和静态文件不压缩
+app.add_middleware(CompressionMiddleware)
 
-URL = 'http://10.176.64.152:11434/v1'
 MODEL = 'qwen2.5:7b'
 
+# 检索模式：hybrid（BM25 + 向量检索融合）或 dense（仅向量检索），便于用 evaluate_r_script.py 对比
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+# 参考文本在提示词中可占用的token预算（按模型分词器计算）
+PROMPT_CONTEXT_BUDGET = int(os.getenv("PROMPT_CONTEXT_BUDGET", "1500"))
+LATEX_PROMPT_BUDGET = int(os.getenv("LATEX_PROMPT_BUDGET", "3000"))
+
+# 检索后处理：合并相邻文本块并多样化后送入重排序的候选数、每篇论文最多保留的块数和MMR权衡系数
+DIVERSIFY_TOP_N = int(os.getenv("DIVERSIFY_TOP_N", "12"))
+MAX_CHUNKS_PER_SOURCE = int(os.getenv("MAX_CHUNKS_PER_SOURCE", "3"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
 chroma_client = chromadb.HttpClient(host='localhost', port=8002)
 
 # 创建全局session用于HTTP连接复用
 http_session = requests.Session()
 
+# 大模型和重排序服务可部署多台，逗号分隔，按最少未完成请求路由，故障节点自动熔断
+llm_pool = upstream.UpstreamPool(
+    upstream.urls_from_env("LLM_URLS", "http://10.176.64.152:11434/v1"),
+    name="llm",
+    session=http_session
+)
+rerank_pool = upstream.UpstreamPool(
+    upstream.urls_from_env("RERANK_URLS", "http://10.176.64.152:11436/v1"),
+    name="rerank",
+    session=http_session
+)
+
+# 大模型补全结果缓存，仅在temperature为0或调用方显式开启时使用
+completion_cache = llm_cache.CompletionCache(
+    directory=os.getenv("LLM_CACHE_DIR", "cache/llm"),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl=int(os.getenv("LLM_CACHE_TTL", "86400")),
+    max_disk_bytes=int(os.getenv("LLM_CACHE_MAX_DISK_MB", "256")) * 1024 * 1024,
+)
+
+# 合并并发到达的相同 /writing/ 和 /chat/ 请求，避免重复点击时重复调用大模型
+writing_flight = singleflight.SingleFlight()
+chat_flight = singleflight.SingleFlight()
+
+# 大模型调用的准入控制：限制并发，按优先级和用户公平排队，队列过深时返回429
+llm_scheduler = scheduler.LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    max_queue_depth=int(os.getenv("LLM_MAX_QUEUE_DEPTH", "32")),
+)
+
+
+# LaTeX 编译服务：限制同时运行的 xelatex 进程数，每遍超时 30 秒，同一文档复用构建目录
+latex_compiler = latex_compiler_module.LatexCompiler(
+    workers=int(os.getenv("LATEX_WORKERS", "2")),
+    max_queue=int(os.getenv("LATEX_MAX_QUEUE", "32")),
+    timeout=30,
+    build_dir=os.getenv("LATEX_BUILD_DIR", "cache/latex_build"),
+    max_build_dirs=int(os.getenv("LATEX_MAX_BUILD_DIRS", "64")),
+    max_passes=int(os.getenv("LATEX_MAX_PASSES", "4")),
+    precompile_preamble=os.getenv("LATEX_PRECOMPILE_PREAMBLE", "0") == "1",
+)
+
+
+# static/output 中编译产物的内容寻址存储，超出大小上限时按最近使用淘汰
+output_store = output_store_module.OutputStore(
+    "static/output",
+    max_bytes=int(os.getenv("OUTPUT_MAX_MB", "512")) * 1024 * 1024,
+    orphan_age=int(os.getenv("OUTPUT_ORPHAN_AGE", "3600")),
+)
+compile_flight = singleflight.SingleFlight()
+
+# 启动时在线程中加载分词器的任务（保存引用，避免任务被回收）
+tokenizer_task = None
+
+
+def caller_identity(request: Request):
+    """识别调用用户，用于公平排队：优先使用业务层转发的 X-User，其次取 JWT 中的 sub，最后用客户端地址"""
+    user = request.headers.get("x-user")
+    if user:
+        return user
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        # 这里只用于区分用户，不做签名校验
+        try:
+            payload = authorization.split(" ", 1)[1].split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            if claims.get("sub"):
+                return str(claims["sub"])
+        except (IndexError, ValueError):
+            pass
+    return request.client.host if request.client else "anonymous"
+
+
+async def chat_completion(messages, timeout=60, cache=False, user="anonymous",
+                          priority=scheduler.PRIORITY_DEFAULT, **sampling):
+    """调用大模型非流式补全接口，确定性请求命中缓存时直接返回，否则经调度器排队后请求"""
+    payload = {
+        'model': MODEL,
+        'stream': False,
+        'messages': messages,
+    }
+    payload.update({name: value for name, value in sampling.items() if value is not None})
+    use_cache = cache or payload.get('temperature') == 0
+    if use_cache:
+        key = llm_cache.make_key(payload)
+        cached = await asyncio.to_thread(completion_cache.get, key)
+        if cached is not None:
+            return cached
+    async with llm_scheduler.slot(user, priority):
+        # 补全请求没有副作用，失败时可换节点重试
+        resp = await asyncio.to_thread(
+            llm_pool.post, '/chat/completions', json=payload, timeout=timeout
+        )
+    response_data = resp.json()
+    if use_cache and resp.status_code == 200 and response_data.get("choices"):
+        await asyncio.to_thread(completion_cache.set, key, response_data)
+    return response_data
+
 # 创建静态文件目录（如果不存在）
 os.makedirs("static/output", exist_ok=True)
 
@@ -62,16 +178,52 @@ async def startup_db_client():
             os.makedirs(pdf_directory)
             print(f"创建目录: {pdf_directory}")
         
+        # 先用向量数据库中已有的文档初始化关键词索引
+        try:
+            pdf_to_vectordb.load_keyword_index_from_collection()
+        except Exception as e:
+            print(f"初始化关键词索引失败: {e}")
+        
         # 处理目录中的所有PDF文件
         pdf_to_vectordb.process_pdf_directory(pdf_directory)
         print("PDF文件加载完成！")
     
+    # 在线程中预先加载分词器（可能需要下载），不阻塞事件循环；加载完成前到达的请求在线程中等待
+    global tokenizer_task
+    tokenizer_task = asyncio.create_task(asyncio.to_thread(prompt_budget.get_tokenizer))
+    
+    # 启动时清理 static/output 中的孤立文件
+    threading.Thread(target=output_store.cleanup, daemon=True).start()
+    
     # 在后台线程中运行，不阻塞FastAPI启动
     thread = threading.Thread(target=load_pdfs)
     thread.daemon = True  # 设置为守护线程，当主程序退出时，线程也会退出
     thread.start()
 
 
+@app.exception_handler(scheduler.QueueFullError)
+async def queue_full_handler(request: Request, exc: scheduler.QueueFullError):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
+@app.get("/metrics/")
+async def metrics():
+    return {
+        "prompt_budget": prompt_budget.get_stats(),
+        "completion_cache": completion_cache.get_stats(),
+        "writing_coalescing": writing_flight.get_stats(),
+        "chat_coalescing": chat_flight.get_stats(),
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "latex_compiler": latex_compiler.get_stats(),
+        "output_store": output_store.get_stats(),
+        "upstreams": {
+            "llm": llm_pool.get_stats(),
+            "embedding": pdf_to_vectordb.embedding_pool.get_stats(),
+            "rerank": rerank_pool.get_stats(),
+        },
+    }
+
+
 # 在现有代码中添加以下端点
 
 @app.post("/clear_vectordb")
@@ -93,6 +245,7 @@ async def clear_vectordb():
                 print(f"已清空向量数据库中的papers_collection，删除了{len(results['ids'])}个文档")
             else:
                 print("向量数据库中没有文档需要删除")
+            pdf_to_vectordb.keyword_index.clear()
                 
             return {"status": "success", "message": "向量数据库已清空"}
         except Exception as e:
@@ -104,14 +257,16 @@ async def clear_vectordb():
         return {"status": "error", "message": f"连接向量数据库时出错: {str(e)}"}
 
 @app.post("/chat/stream/")
-async def chat_stream(conversation: schemas.Conversation):
+async def chat_stream(conversation: schemas.Conversation, request: Request):
 
     def generator():
-        with http_session.post(f'{URL}/chat/completions', json={
+        payload = {
             'model': MODEL,
             'stream': True,
             'messages': [m.model_dump() for m in conversation.messages],
-        }, stream=True, timeout=60) as resp:
+        }
+        payload.update(conversation.model_dump(include={'temperature', 'top_p'}, exclude_none=True))
+        with llm_pool.stream('POST', '/chat/completions', json=payload, timeout=60) as resp:
             for raw_line in resp.iter_lines():
                 line = raw_line.decode('utf-8').strip()
                 if line == '':
@@ -127,31 +282,53 @@ async def chat_stream(conversation: schemas.Conversation):
                 # print(json.loads(line))
                 yield raw_line + b'\n'
     
-    return StreamingResponse(generator())
+    # 流式聊天优先级最高，整个流式响应期间占用一个并发名额。
+    # 名额在生成器内部取得：客户端在开始迭代前断开时生成器不会运行，也就不会占用名额；
+    # 队列已满时仍在返回响应前快速返回429
+    llm_scheduler.ensure_capacity()
+    user = caller_identity(request)
+    
+    async def scheduled_stream():
+        async with llm_scheduler.slot(user, scheduler.PRIORITY_INTERACTIVE):
+            async for chunk in iterate_in_threadpool(generator()):
+                yield chunk
+    
+    return StreamingResponse(scheduled_stream())
 
 
 @app.post("/chat/", response_model=schemas.ConversationResponse)
-async def chat(conversation: schemas.Conversation):
-    resp = http_session.post(f'{URL}/chat/completions', json={
-        'model': MODEL,
-        'stream': False,
-        'messages': [m.model_dump() for m in conversation.messages],
-    }, stream=False, timeout=60)
-    return resp.json()
+async def chat(conversation: schemas.Conversation, request: Request):
+    key = singleflight.request_key("chat", conversation)
+    return await chat_flight.do(key, lambda: chat_completion(
+        [m.model_dump() for m in conversation.messages],
+        timeout=60,
+        cache=conversation.cache,
+        user=caller_identity(request),
+        priority=scheduler.PRIORITY_INTERACTIVE,
+        temperature=conversation.temperature,
+        top_p=conversation.top_p,
+    ))
 
 
 
 # /writing/ 接口
 @app.post("/writing/", response_model=schemas.PassageResponse)
+async def writing(passage_idea: schemas.PassageIdea, request: Request):
+    # 队列已满时在检索之前就拒绝
+    llm_scheduler.ensure_capacity()
+    # 相同的请求并发到达时共享同一次计算
+    key = singleflight.request_key("writing", passage_idea)
+    return await writing_flight.do(key, lambda: generate_passage(passage_idea, caller_identity(request)))
+
 
-async def writing(passage_idea: schemas.PassageIdea):
+async def generate_passage(passage_idea: schemas.PassageIdea, user: str = "anonymous"):
     
     def generator(conversation):
-        with http_session.post(f'{URL}/chat/completions', json={
+        with llm_pool.stream('POST', '/chat/completions', json={
             'model': MODEL,
             'stream': True,
             'messages': [m.model_dump() for m in conversation.messages],
-        }, stream=True, timeout=60) as resp:
+        }, timeout=60) as resp:
             for raw_line in resp.iter_lines():
                 line = raw_line.decode('utf-8').strip()
                 if line == '':
@@ -170,27 +347,58 @@ async def writing(passage_idea: schemas.PassageIdea):
     # 1. 从向量数据库中查找相关文本
 
     # 使用 chromadb 客户端连接到向量数据库
-    collection = chroma_client.get_collection("papers_collection")
+    collection = await asyncio.to_thread(chroma_client.get_collection, "papers_collection")
     # 移除这一行，它可能导致问题
     collection._embedding_function = openai_ef
     
     # 使用 passage_tag 作为查询关键词
     query = " ".join(passage_idea.passage_tag)
     
-    # 简化查询，不设置额外参数，获取更多候选结果用于重排序
-    results = collection.query(
+    # 向量检索与BM25关键词检索并发执行，获取更多候选结果用于重排序
+    retrieval_start = time.perf_counter()
+    dense_task = asyncio.to_thread(
+        collection.query,
         query_texts=[query],
-        n_results=20  # 增加候选数量用于重排序
+        n_results=20,  # 增加候选数量用于重排序
+        include=["documents", "metadatas", "embeddings"]
     )
+    if RETRIEVAL_MODE == "hybrid":
+        keyword_task = asyncio.to_thread(pdf_to_vectordb.keyword_index.search, query, 20)
+        results, keyword_hits = await asyncio.gather(dense_task, keyword_task)
+        # 用倒数排名融合合并两路结果
+        ids, documents, metadata, embeddings = retrieval.fuse_dense_and_keyword(
+            results, keyword_hits, pdf_to_vectordb.keyword_index, n_results=20
+        )
+        # 仅由BM25命中的文本块补取向量，用于多样化
+        missing_ids = [doc_id for doc_id, embedding in zip(ids, embeddings) if embedding is None]
+        if missing_ids:
+            fetched = await asyncio.to_thread(collection.get, ids=missing_ids, include=["embeddings"])
+            fetched_embeddings = dict(zip(fetched.get("ids", []), fetched.get("embeddings") if fetched.get("embeddings") is not None else []))
+            embeddings = [fetched_embeddings.get(doc_id) if embedding is None else embedding
+                          for doc_id, embedding in zip(ids, embeddings)]
+    else:
+        results = await dense_task
+        # 提取文本内容和元数据
+        documents = results.get("documents", [[]])[0]
+        metadata = results.get("metadatas", [[]])[0]
+        embeddings = results.get("embeddings")
+        embeddings = embeddings[0] if embeddings is not None else [None] * len(documents)
+    print(f"检索耗时({RETRIEVAL_MODE}): {(time.perf_counter() - retrieval_start) * 1000:.1f} ms")
     
-    # 提取文本内容和元数据
-    documents = results.get("documents", [[]])[0]
-    metadata = results.get("metadatas", [[]])[0]
+    # 合并同一论文的相邻文本块，MMR多样化并限制每篇论文的块数，减少重排序和提示词的冗余
+    candidate_count = len(documents)
+    documents, metadata = retrieval.diversify(
+        documents, metadata, embeddings,
+        top_n=DIVERSIFY_TOP_N,
+        mmr_lambda=MMR_LAMBDA,
+        max_per_source=MAX_CHUNKS_PER_SOURCE
+    )
+    print(f"检索后处理: {candidate_count} 个候选文本块 -> {len(documents)} 个")
     
     # 2. 使用重排序API优化结果
     if documents:  # 确保有文档可以重排序
         try:
-            rerank_response = http_session.post("http://10.176.64.152:11436/v1/rerank", json={
+            rerank_response = await asyncio.to_thread(rerank_pool.post, "/rerank", json={
                 "model": "bge-reranker-v2-m3",
                 "query": query,
                 "documents": documents,
@@ -200,25 +408,37 @@ async def writing(passage_idea: schemas.PassageIdea):
             if rerank_response.status_code == 200:
                 rerank_data = rerank_response.json()
                 # 根据重排序结果重新排列文档和元数据
-                reranked_indices = [item["index"] for item in rerank_data.get("results", [])]
+                rerank_results = rerank_data.get("results", [])
+                reranked_indices = [item["index"] for item in rerank_results]
                 passage_sentences = [documents[i] for i in reranked_indices]
-                reranked_metadata = [metadata[i] for i in reranked_indices]
-                references = [f"Reference {i+1}: {meta.get('source', 'Unknown')}" for i, meta in enumerate(reranked_metadata)]
+                passage_metadata = [metadata[i] for i in reranked_indices]
+                passage_scores = [item.get("relevance_score", 0.0) for item in rerank_results]
             else:
                 # 重排序失败时使用原始结果
                 passage_sentences = documents[:10]
-                references = [f"Reference {i+1}: {meta.get('source', 'Unknown')}" for i, meta in enumerate(metadata[:10])]
+                passage_metadata = metadata[:10]
+                passage_scores = [-i for i in range(len(passage_sentences))]
         except Exception as e:
             # 重排序出错时使用原始结果
             print(f"Reranking failed: {e}")
             passage_sentences = documents[:10]
-            references = [f"Reference {i+1}: {meta.get('source', 'Unknown')}" for i, meta in enumerate(metadata[:10])]
+            passage_metadata = metadata[:10]
+            passage_scores = [-i for i in range(len(passage_sentences))]
     else:
         passage_sentences = []
-        references = []
+        passage_metadata = []
+        passage_scores = []
+    
+    # 按重排序分数在token预算内保留参考文本，参考文献与保留的文本保持一致；分词较慢，在线程中执行
+    all_passage_sentences = passage_sentences
+    kept_indices, passage_sentences = await asyncio.to_thread(
+        prompt_budget.fit_by_priority, passage_sentences, passage_scores, PROMPT_CONTEXT_BUDGET
+    )
+    passage_scores = [passage_scores[i] for i in kept_indices]
+    references = retrieval.unique_references([passage_metadata[i] for i in kept_indices])
     
     # 3. 构建合并后的提示词
-    prompt = f"""请根据关键词：{', '.join(passage_idea.passage_tag)}，以markdown格式写作文献综述中的'{passage_idea.passage_type}'段落。
+    prompt_header = f"""请根据关键词：{', '.join(passage_idea.passage_tag)}，以markdown格式写作文献综述中的'{passage_idea.passage_type}'段落。
 
 要求：
 1. 使用简体中文markdown格式
@@ -232,8 +452,13 @@ async def writing(passage_idea: schemas.PassageIdea):
 
 以下是文献综述参考文本内容："""
     
-    for i, sentence in enumerate(passage_sentences):
-        prompt += f"\n文本{i+1}: {sentence}"
+    def build_prompt(sentences):
+        prompt = prompt_header
+        for i, sentence in enumerate(sentences):
+            prompt += f"\n文本{i+1}: {sentence}"
+        return prompt
+    
+    prompt = build_prompt(passage_sentences)
     
     # 4. 发送到本地 /chat 接口（合并为一次请求）
     conversation = schemas.Conversation(
@@ -244,17 +469,31 @@ async def writing(passage_idea: schemas.PassageIdea):
     )
     
     # 使用非流式接口获取响应
-    resp = http_session.post(f'{URL}/chat/completions', json={
-        'model': MODEL,
-        'stream': False,
-        'messages': [m.model_dump() for m in conversation.messages],
-    }, timeout=60)
+    response_data = await chat_completion(
+        [m.model_dump() for m in conversation.messages],
+        timeout=60,
+        cache=passage_idea.cache,
+        user=user,
+        temperature=passage_idea.temperature,
+    )
     
-    response_data = resp.json()
     ai_response = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
     
     # 5. 第二次请求：用相同提示词再次格式化第一次生成的段落
-    prompt += f"\n第一次生成结果如下，请继续规范\n" + ai_response
+    # 第一次结果也占用预算，参考文本按优先级再裁剪一次，保证整体提示词不超出预算
+    second_suffix = f"\n第一次生成结果如下，请继续规范\n" + ai_response
+    
+    def build_second_prompt():
+        second_budget = PROMPT_CONTEXT_BUDGET - prompt_budget.count_tokens(ai_response)
+        _, second_sentences = prompt_budget.fit_by_priority(passage_sentences, passage_scores, second_budget)
+        unbudgeted_prompt = build_prompt(all_passage_sentences)
+        original_tokens = prompt_budget.count_tokens(unbudgeted_prompt) * 2 + prompt_budget.count_tokens(second_suffix)
+        second_prompt = build_prompt(second_sentences) + second_suffix
+        final_tokens = prompt_budget.count_tokens(conversation.messages[1].content) + prompt_budget.count_tokens(second_prompt)
+        prompt_budget.record(original_tokens, final_tokens, label="(/writing/)")
+        return second_prompt
+    
+    prompt = await asyncio.to_thread(build_second_prompt)
     second_conversation = schemas.Conversation(
         messages=[
             schemas.Message(role="system", content="你是一个专业的学术论文写作助手，擅长根据参考文献生成高质量的论文段落。请严格按照用户要求的格式和字数限制输出内容。"),
@@ -263,13 +502,14 @@ async def writing(passage_idea: schemas.PassageIdea):
     )
     
     # 发送第二次请求
-    second_resp = http_session.post(f'{URL}/chat/completions', json={
-        'model': MODEL,
-        'stream': False,
-        'messages': [m.model_dump() for m in second_conversation.messages],
-    }, timeout=60)
+    second_response_data = await chat_completion(
+        [m.model_dump() for m in second_conversation.messages],
+        timeout=60,
+        cache=passage_idea.cache,
+        user=user,
+        temperature=passage_idea.temperature,
+    )
     
-    second_response_data = second_resp.json()
     final_ai_response = second_response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
     
     # 使用第二次请求的结果作为最终响应
@@ -304,114 +544,104 @@ async def writing(passage_idea: schemas.PassageIdea):
 
 
 @app.post("/writing/output/", response_model=schemas.LatexOutputResponse)
-async def generate_latex_output(request: schemas.LatexOutputRequest):
-    # 1. 构建提示词，要求模型生成 LaTeX 文档
-    passages_text = ""
-    for i, passage in enumerate(request.passages):
-        passages_text += f"段落{i+1} - {passage.passage_type}:\n"
-        passages_text += f"标题: {passage.passage_title}\n"
-        passages_text += f"内容: {passage.passage}\n"
-        if passage.references:
-            passages_text += "参考文献:\n"
-            for ref in passage.references:
-                passages_text += f"- {ref}\n"
-        passages_text += "\n"
-    
-    prompt = f"""请根据以下内容生成一个完整的 LaTeX 文档:
-
-论文标题: {request.paper_title}
-作者: {request.author_name}
-模板类型: {request.template_type}
-
-段落内容:
-{passages_text}
-
-请生成一个完整的、可编译的 LaTeX 文档，包括以下要求:
-1. 使用 {request.template_type} 文档类
-2. 包含所有必要的宏包和设置
-3. 正确设置中文支持（使用 ctex 宏包）
-4. 按照提供的段落顺序组织文档
-5. 为每个段落创建适当的章节结构
-6. 包含所有参考文献
-7. 确保文档可以直接编译成 PDF
-
-只需返回完整的 LaTeX 代码，不需要解释。
-"""
-    
-    # 2. 发送到本地 /chat 接口
-    conversation = schemas.Conversation(
-        messages=[
-            schemas.Message(role="system", content="你是一个专业的 LaTeX 文档生成助手，擅长将文本内容转换为格式良好的 LaTeX 文档。"),
-            schemas.Message(role="user", content=prompt)
-        ]
-    )
-    
-    resp = http_session.post(f'{URL}/chat/completions', json={
-        'model': MODEL,
-        'stream': False,
-        'messages': [m.model_dump() for m in conversation.messages],
-    }, stream=False, timeout=120)
-    
-    response_data = resp.json()
-    latex_content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-    
-    # 3. 提取 LaTeX 代码（如果模型返回的内容包含代码块标记）
-    if "```latex" in latex_content and "```" in latex_content.split("```latex", 1)[1]:
-        latex_content = latex_content.split("```latex", 1)[1].split("```", 1)[0].strip()
-    elif "```" in latex_content and "```" in latex_content.split("```", 1)[1]:
-        latex_content = latex_content.split("```", 1)[1].split("```", 1)[0].strip()
-    
-    # 4. 生成唯一的文件名
-    file_id = str(uuid.uuid4())
-    tex_filename = f"{file_id}.tex"
-    pdf_filename = f"{file_id}.pdf"
+async def generate_latex_output(request: schemas.LatexOutputRequest, http_request: Request):
+    # 1. 可选：让大模型逐段润色正文（保持 markdown 格式，不生成 LaTeX）
+    if request.polish:
+        llm_scheduler.ensure_capacity()
+        request = await polish_passages(request, caller_identity(http_request))
     
-    # 确保输出目录存在
-    os.makedirs("static/output", exist_ok=True)
+    # 2-3. 用模板确定性地拼装 LaTeX 文档，结构、宏包和参考文献都由模板保证
+    latex_content = latex_template.render_document(request)
     
-    tex_path = os.path.join("static/output", tex_filename)
-    pdf_path = os.path.join("static/output", pdf_filename)
+    # 4. 按 LaTeX 源码的哈希命名文件，相同的文档直接复用已编译的 PDF
+    doc_key = output_store.key_for(latex_content)
+    tex_path, pdf_path = output_store.paths(doc_key)
+    pdf_filename = os.path.basename(pdf_path)
     
-    # 5. 保存 LaTeX 文件
-    with open(tex_path, "w", encoding="utf-8") as f:
-        f.write(latex_content)
-    
-    # 6. 编译 LaTeX 文件生成 PDF
-    try:
-        # 创建临时目录用于编译
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # 复制 tex 文件到临时目录
-            tmp_tex_path = os.path.join(tmpdir, tex_filename)
-            with open(tmp_tex_path, "w", encoding="utf-8") as f:
-                f.write(latex_content)
-            
-            # 在临时目录中编译
-            subprocess.run(
-                ["xelatex", "-interaction=nonstopmode", tex_filename],
-                cwd=tmpdir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=30
-            )
-            
-            # 如果生成了 PDF，复制到目标位置
-            tmp_pdf_path = os.path.join(tmpdir, pdf_filename)
-            if os.path.exists(tmp_pdf_path):
-                with open(tmp_pdf_path, "rb") as src, open(pdf_path, "wb") as dst:
-                    dst.write(src.read())
-    except Exception as e:
-        # 如果编译失败，记录错误但继续返回 tex 内容
-        print(f"PDF 编译失败: {str(e)}")
+    if await asyncio.to_thread(output_store.lookup, doc_key):
+        job_id = ""
+        compiled = True
+    else:
+        # 5-6. 保存并编译，相同文档的并发编译只执行一次
+        build_key = latex_build_key(request, doc_key, caller_identity(http_request))
+        job = await compile_flight.do(doc_key, lambda: compile_latex(latex_content, doc_key, build_key))
+        job_id = job.id
+        compiled = job.status == "done"
     
     # 7. 返回 tex 内容和 PDF 文件的 URL
     # 修改返回的URL路径，确保前端可以正确访问
-    pdf_url = f"/api/static/output/{pdf_filename}" if os.path.exists(pdf_path) else ""
+    pdf_url = f"/api/static/output/{pdf_filename}" if compiled else ""
     
     return schemas.LatexOutputResponse(
         tex_content=latex_content,
-        pdf_url=pdf_url
+        pdf_url=pdf_url,
+        job_id=job_id
     )
 
+
+async def polish_passages(request, user):
+    """并发润色各段落正文；超出预算或调用失败的段落保留原文"""
+    async def polish(passage):
+        tokens = await asyncio.to_thread(prompt_budget.count_tokens, passage.passage)
+        if tokens > LATEX_PROMPT_BUDGET:
+            print(f"段落「{passage.passage_title}」约 {tokens} tokens，超出润色预算，保留原文")
+            return passage
+        try:
+            response_data = await chat_completion(
+                [
+                    {"role": "system", "content": "你是一个专业的学术写作助手，擅长润色论文段落。"},
+                    {"role": "user", "content": f"请润色以下论文段落的语言，使其更加通顺、学术化。保持原意和 markdown 格式，不要添加标题、引用标记或解释，只返回润色后的段落:\n\n{passage.passage}"}
+                ],
+                timeout=120,
+                cache=request.cache,
+                user=user,
+                priority=scheduler.PRIORITY_BATCH,
+                temperature=request.temperature,
+            )
+        except scheduler.QueueFullError:
+            raise
+        except Exception as e:
+            print(f"段落润色失败，保留原文: {str(e)}")
+            return passage
+        content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        return passage.model_copy(update={"passage": content}) if content else passage
+    
+    passages = await asyncio.gather(*(polish(passage) for passage in request.passages))
+    return request.model_copy(update={"passages": list(passages)})
+
+
+def latex_build_key(request, doc_key, user):
+    """构建目录的键：提供 document_id 时同一用户同一篇论文的多次编译共用构建目录，增量编译；
+    否则使用完整 LaTeX 源码的哈希 doc_key，只有内容完全相同的文档才共用，不同文档不会冲突
+    （标题、作者等元数据可能相同，例如都使用默认值）"""
+    if not request.document_id:
+        return doc_key
+    identity = "\0".join([user, request.document_id])
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+async def compile_latex(latex_content, doc_key, build_key):
+    tex_path, pdf_path = output_store.paths(doc_key)
+    
+    # 5. 保存 LaTeX 文件（只写一次，编译直接读取该文件）
+    await asyncio.to_thread(Path(tex_path).write_text, latex_content, encoding="utf-8")
+    
+    # 6. 提交到编译服务排队编译，不阻塞其他请求
+    job = latex_compiler.submit(tex_path, pdf_path, build_key)
+    await job.done.wait()
+    
+    # 编译完成后清理孤立文件并按大小淘汰最久未使用的文档
+    await asyncio.to_thread(output_store.cleanup, protected={doc_key})
+    return job
+
+
+@app.get("/writing/output/jobs/{job_id}", response_model=schemas.LatexJobStatus)
+async def get_latex_job(job_id: str):
+    job = latex_compiler.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="编译任务不存在")
+    return job.to_dict()
+
 # 添加PDF上传接口
 @app.post("/papers/upload/")
 async def upload_paper(file: UploadFile = File(...)):
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+# 内容寻址的文件名：LaTeX 源码 sha256 的前32位
+_ARTIFACT_PATTERN = re.compile(r"^[0-9a-f]{32}\.(tex|pdf)$")
+
+
+class OutputStore:
+    """static/output 中编译产物的内容寻址存储：相同 LaTeX 源码复用 PDF，按总大小做 LRU 淘汰"""
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, orphan_age=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.orphan_age = orphan_age
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evicted_files": 0, "orphans_removed": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key_for(latex_content):
+        return hashlib.sha256(latex_content.encode("utf-8")).hexdigest()[:32]
+
+    def paths(self, key):
+        return os.path.join(self.directory, f"{key}.tex"), os.path.join(self.directory, f"{key}.pdf")
+
+    def lookup(self, key):
+        """PDF 已存在时刷新其访问时间（用于LRU）并返回 True"""
+        tex_path, pdf_path = self.paths(key)
+        try:
+            os.utime(pdf_path)
+            if os.path.exists(tex_path):
+                os.utime(tex_path)
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return False
+        with self._lock:
+            self._stats["hits"] += 1
+        return True
+
+    def cleanup(self, protected=()):
+        """清理孤立文件并按最近使用时间淘汰，直到总大小不超过上限；protected 中的键不会被删除"""
+        now = time.time()
+        entries = {}  # key -> [文件路径列表, 总大小, 最近修改时间, 是否有pdf]
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if not _ARTIFACT_PATTERN.match(entry.name):
+                # 旧版 uuid 命名的文件和编译残留：超过保留时间即删除
+                if now - stat.st_mtime > self.orphan_age:
+                    self._remove(entry.path, "orphans_removed")
+                continue
+            key = entry.name[:32]
+            item = entries.setdefault(key, [[], 0, 0.0, False])
+            item[0].append(entry.path)
+            item[1] += stat.st_size
+            item[2] = max(item[2], stat.st_mtime)
+            item[3] = item[3] or entry.name.endswith(".pdf")
+
+        total = 0
+        for key, (paths, size, mtime, has_pdf) in list(entries.items()):
+            # 只有 tex 没有 pdf 的是编译失败的残留
+            if not has_pdf and key not in protected and now - mtime > self.orphan_age:
+                for path in paths:
+                    self._remove(path, "orphans_removed")
+                del entries[key]
+                continue
+            total += size
+
+        for key, (paths, size, _, _) in sorted(entries.items(), key=lambda item: item[1][2]):
+            if total <= self.max_bytes:
+                break
+            if key in protected:
+                continue
+            for path in paths:
+                self._remove(path, "evicted_files")
+            total -= size
+        return total
+
+    def _remove(self, path, counter):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._stats[counter] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -7,14 +7,18 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 import fitz  # 新增
 import requests  # 新增
 import base64  # 新增
+from bm25_index import BM25Index
+import upstream
 
-# 配置OpenAI embedding函数
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key="API_KEY_IS_NOT_NEEDED",
-    api_base="http://10.176.64.152:11435/v1",
-    model_name="bge-m3"
+# embedding服务可部署多台，逗号分隔，由客户端负载均衡
+embedding_pool = upstream.UpstreamPool(
+    upstream.urls_from_env("EMBEDDING_URLS", "http://10.176.64.152:11435/v1"),
+    name="embedding"
 )
 
+# 配置OpenAI兼容的embedding函数
+openai_ef = upstream.BalancedEmbeddingFunction(embedding_pool, model_name="bge-m3")
+
 # 连接到向量数据库
 client = chromadb.HttpClient(host='localhost', port=8002)
 
@@ -27,6 +31,17 @@ except:
     collection = client.create_collection(name=collection_name, embedding_function=openai_ef)
     print(f"创建新的collection: {collection_name}")
 
+# 关键词倒排索引，与向量数据库同步增量构建，供混合检索使用
+keyword_index = BM25Index()
+
+def load_keyword_index_from_collection():
+    """用向量数据库中已有的文档初始化关键词索引"""
+    results = collection.get(include=["documents", "metadatas"])
+    ids = results.get("ids") or []
+    if ids:
+        keyword_index.add(ids, results["documents"], results["metadatas"])
+    print(f"关键词索引已加载 {len(ids)} 个文本块")
+
 def extract_text_and_formula_from_pdf(pdf_path):
     """从PDF文件中提取文本和公式（公式图片用Mathpix识别为LaTeX）"""
     doc = fitz.open(pdf_path)
@@ -95,6 +110,7 @@ def add_pdf_to_vectordb(pdf_path):
             documents=chunks,
             metadatas=metadatas
         )
+        keyword_index.add(ids, chunks, metadatas)
         
         print(f"已将 {filename} 添加到向量数据库，共 {len(chunks)} 个文本块")
     except Exception as e:
@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+
+# 与推理服务一致的分词器（HuggingFace名称或本地路径），加载失败时退化为按字符估算
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "Qwen/Qwen2.5-7B-Instruct")
+
+_CJK_PATTERN = re.compile(r"[　-〿一-鿿＀-￯]")
+_SENTENCE_END_PATTERN = re.compile(r"[。！？；.!?;\n]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+# 累计统计，供 /metrics/ 接口查看
+stats = {
+    "prompts": 0,
+    "original_tokens": 0,
+    "final_tokens": 0,
+    "tokens_saved": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """懒加载模型分词器，未安装 transformers 或加载失败时返回 None"""
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+            except Exception as e:
+                print(f"加载分词器失败，改用字符数估算token: {e}")
+                _tokenizer = None
+            _tokenizer_loaded = True
+    return _tokenizer
+
+
+def count_tokens(text):
+    """计算文本的token数"""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    # 估算：中文字符约1个token，其余字符约4个字符1个token
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """把文本截断到 max_tokens 以内，尽量在句末截断"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        ids = tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+        truncated = tokenizer.decode(ids)
+    else:
+        # 二分查找满足预算的最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        truncated = text[:low]
+    # 句末位置不太靠前时在句末截断，避免半句话
+    ends = [match.end() for match in _SENTENCE_END_PATTERN.finditer(truncated)]
+    if ends and ends[-1] >= len(truncated) * 0.6:
+        truncated = truncated[:ends[-1]]
+    return truncated.rstrip()
+
+
+def fit_by_priority(texts, scores, budget, min_tokens=32):
+    """按分数从高到低保留文本直到用完预算，最后一段放不下时截断
+
+    返回保留下来的文本下标和对应（可能被截断的）文本，顺序与优先级一致。
+    """
+    order = sorted(range(len(texts)), key=lambda i: scores[i], reverse=True)
+    kept_indices, kept_texts = [], []
+    remaining = budget
+    for index in order:
+        tokens = count_tokens(texts[index])
+        if tokens <= remaining:
+            kept_indices.append(index)
+            kept_texts.append(texts[index])
+            remaining -= tokens
+        elif remaining >= min_tokens:
+            kept_indices.append(index)
+            kept_texts.append(truncate_to_tokens(texts[index], remaining))
+            remaining = 0
+        if remaining < min_tokens:
+            break
+    return kept_indices, kept_texts
+
+
+def record(original_tokens, final_tokens, label=""):
+    """记录一次提示词裁剪的token节省情况并打印日志"""
+    saved = max(original_tokens - final_tokens, 0)
+    with _stats_lock:
+        stats["prompts"] += 1
+        stats["original_tokens"] += original_tokens
+        stats["final_tokens"] += final_tokens
+        stats["tokens_saved"] += saved
+    print(f"提示词预算{label}: {original_tokens} tokens -> {final_tokens} tokens，节省 {saved} tokens")
+    return saved
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(stats)
@@ -0,0 +1,160 @@
+import numpy as np
+
+
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """倒数排名融合（RRF）：rankings 为多个按相关度排序的id列表，返回融合后的id列表"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+    return fused[:limit] if limit is not None else fused
+
+
+def fuse_dense_and_keyword(dense_results, keyword_hits, keyword_index, n_results=20):
+    """融合向量检索结果（collection.query 的返回）与BM25结果
+
+    返回 (ids, documents, metadatas, embeddings)，仅由BM25命中的文档向量为 None。
+    """
+    dense_ids = dense_results.get("ids", [[]])[0]
+    dense_documents = dense_results.get("documents", [[]])[0]
+    dense_metadatas = dense_results.get("metadatas", [[]])[0]
+    dense_embeddings = dense_results.get("embeddings")
+    dense_embeddings = dense_embeddings[0] if dense_embeddings is not None else [None] * len(dense_ids)
+    lookup = {
+        doc_id: (document, metadata, embedding)
+        for doc_id, document, metadata, embedding in zip(dense_ids, dense_documents, dense_metadatas, dense_embeddings)
+    }
+
+    keyword_ids = [doc_id for doc_id, _ in keyword_hits]
+    fused_ids = reciprocal_rank_fusion([dense_ids, keyword_ids], limit=n_results)
+
+    # 仅由BM25命中的文档从倒排索引中取回内容
+    missing = [doc_id for doc_id in fused_ids if doc_id not in lookup]
+    if missing:
+        documents, metadatas = keyword_index.get(missing)
+        for doc_id, document, metadata in zip(missing, documents, metadatas):
+            if document is not None:
+                lookup[doc_id] = (document, metadata, None)
+
+    ids = [doc_id for doc_id in fused_ids if doc_id in lookup]
+    return (
+        ids,
+        [lookup[doc_id][0] for doc_id in ids],
+        [lookup[doc_id][1] for doc_id in ids],
+        [lookup[doc_id][2] for doc_id in ids],
+    )
+
+
+def _join_overlapping(previous, following, max_overlap=100, min_overlap=3):
+    """拼接相邻文本块，去掉切分时产生的重叠部分"""
+    for size in range(min(len(previous), len(following), max_overlap), min_overlap - 1, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+
+def merge_adjacent_chunks(documents, metadatas, embeddings):
+    """按 (source, chunk) 合并同一论文中相邻的文本块，保持首次出现的排名顺序
+
+    返回 (documents, metadatas, embeddings)，合并后的向量取各块向量的均值。
+    """
+    groups = {}  # source -> [[chunk, document, metadata, embedding列表, 排名], ...]
+    for rank, (document, metadata, embedding) in enumerate(zip(documents, metadatas, embeddings)):
+        metadata = metadata or {}
+        source = metadata.get("source", "Unknown")
+        groups.setdefault(source, []).append([metadata.get("chunk"), document, metadata, embedding, rank])
+
+    merged = []
+    for source, items in groups.items():
+        numbered = sorted((item for item in items if item[0] is not None), key=lambda item: item[0])
+        current = None
+        for chunk, document, metadata, embedding, rank in numbered:
+            if current is not None and chunk <= current["chunk_end"] + 1:
+                if chunk == current["chunk_end"] + 1:
+                    current["document"] = _join_overlapping(current["document"], document)
+                    current["chunk_end"] = chunk
+                current["embeddings"].append(embedding)
+                current["rank"] = min(current["rank"], rank)
+                continue
+            current = {"source": source, "chunk": chunk, "chunk_end": chunk, "document": document,
+                       "metadata": metadata, "embeddings": [embedding], "rank": rank}
+            merged.append(current)
+        # 没有块号的文本块无法判断是否相邻，原样保留
+        for chunk, document, metadata, embedding, rank in items:
+            if chunk is None:
+                merged.append({"source": source, "chunk": None, "chunk_end": None, "document": document,
+                               "metadata": metadata, "embeddings": [embedding], "rank": rank})
+
+    merged.sort(key=lambda item: item["rank"])
+    result_documents, result_metadatas, result_embeddings = [], [], []
+    for item in merged:
+        metadata = dict(item["metadata"])
+        if item["chunk_end"] is not None and item["chunk_end"] != item["chunk"]:
+            metadata["chunk_end"] = item["chunk_end"]
+        vectors = [vector for vector in item["embeddings"] if vector is not None]
+        result_documents.append(item["document"])
+        result_metadatas.append(metadata)
+        result_embeddings.append(np.mean(np.asarray(vectors, dtype=float), axis=0) if vectors else None)
+    return result_documents, result_metadatas, result_embeddings
+
+
+def mmr_select(embeddings, metadatas, top_n=10, mmr_lambda=0.7, max_per_source=3):
+    """MMR多样化选择：相关度取候选的排名分，冗余度取与已选结果的最大余弦相似度
+
+    候选需已按相关度降序排列，同一来源最多选取 max_per_source 个，返回选中的下标列表。
+    """
+    count = len(embeddings)
+    if count == 0:
+        return []
+    relevance = [1.0 - rank / count for rank in range(count)]
+    normalized = []
+    for vector in embeddings:
+        if vector is None:
+            normalized.append(None)
+            continue
+        vector = np.asarray(vector, dtype=float)
+        norm = np.linalg.norm(vector)
+        normalized.append(vector / norm if norm > 0 else None)
+
+    selected = []
+    per_source = {}
+    remaining = list(range(count))
+    while remaining and len(selected) < top_n:
+        best_index, best_score = None, None
+        for index in remaining:
+            source = (metadatas[index] or {}).get("source", "Unknown")
+            if per_source.get(source, 0) >= max_per_source:
+                continue
+            redundancy = 0.0
+            if normalized[index] is not None:
+                similarities = [float(normalized[index] @ normalized[chosen])
+                                for chosen in selected if normalized[chosen] is not None]
+                redundancy = max(similarities, default=0.0)
+            score = mmr_lambda * relevance[index] - (1 - mmr_lambda) * redundancy
+            if best_score is None or score > best_score:
+                best_index, best_score = index, score
+        if best_index is None:
+            break
+        selected.append(best_index)
+        source = (metadatas[best_index] or {}).get("source", "Unknown")
+        per_source[source] = per_source.get(source, 0) + 1
+        remaining.remove(best_index)
+    return selected
+
+
+def diversify(documents, metadatas, embeddings, top_n=10, mmr_lambda=0.7, max_per_source=3):
+    """检索后处理：合并相邻文本块、MMR多样化并限制每个来源的块数，返回 (documents, metadatas)"""
+    documents, metadatas, embeddings = merge_adjacent_chunks(documents, metadatas, embeddings)
+    selected = mmr_select(embeddings, metadatas, top_n=top_n, mmr_lambda=mmr_lambda, max_per_source=max_per_source)
+    return [documents[i] for i in selected], [metadatas[i] for i in selected]
+
+
+def unique_references(metadatas):
+    """按出现顺序去重参考来源，生成参考文献列表"""
+    sources = []
+    for metadata in metadatas:
+        source = (metadata or {}).get("source", "Unknown")
+        if source not in sources:
+            sources.append(source)
+    return [f"Reference {i+1}: {source}" for i, source in enumerate(sources)]
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# 优先级：数值越小越优先
+PRIORITY_INTERACTIVE = 0  # 聊天等交互请求
+PRIORITY_DEFAULT = 1  # 段落生成
+PRIORITY_BATCH = 2  # LaTeX 文档生成等批量请求
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_DEFAULT: "default",
+    PRIORITY_BATCH: "batch",
+}
+
+
+class QueueFullError(Exception):
+    """排队请求过多，拒绝新请求"""
+
+
+class LLMScheduler:
+    """大模型调用的准入控制：限制并发数，按优先级调度，同一优先级内按用户轮转保证公平
+
+    排队请求数超过 max_queue_depth 时立即抛出 QueueFullError，而不是排队直到超时。
+    """
+
+    def __init__(self, max_concurrency=4, max_queue_depth=32):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self._running = 0
+        self._waiting = 0
+        # priority -> OrderedDict(user -> deque[(future, 入队时间)])，OrderedDict 的顺序即轮转顺序
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._wait_times = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "cancelled": 0}
+
+    def ensure_capacity(self):
+        """在开始耗时的准备工作前快速检查队列深度"""
+        if self._running >= self.max_concurrency and self._waiting >= self.max_queue_depth:
+            self._stats["rejected"] += 1
+            raise QueueFullError(f"大模型服务繁忙，排队请求已达上限 {self.max_queue_depth}")
+
+    async def acquire(self, user="anonymous", priority=PRIORITY_DEFAULT):
+        if priority not in self._queues:
+            priority = PRIORITY_DEFAULT
+        if self._running < self.max_concurrency and self._waiting == 0:
+            self._running += 1
+            self._stats["admitted"] += 1
+            self._wait_times[priority].append(0.0)
+            return
+        if self._waiting >= self.max_queue_depth:
+            self._stats["rejected"] += 1
+            raise QueueFullError(f"大模型服务繁忙，排队请求已达上限 {self.max_queue_depth}")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, time.perf_counter())
+        self._queues[priority].setdefault(user, deque()).append(entry)
+        self._waiting += 1
+        self._stats["queued"] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分配到名额但调用方被取消，归还名额
+                self.release()
+            else:
+                self._remove(priority, user, entry)
+                self._stats["cancelled"] += 1
+            raise
+        self._wait_times[priority].append(time.perf_counter() - entry[1])
+
+    def release(self):
+        self._running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user="anonymous", priority=PRIORITY_DEFAULT):
+        await self.acquire(user, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _remove(self, priority, user, entry):
+        users = self._queues[priority]
+        queue = users.get(user)
+        if queue is None or entry not in queue:
+            return
+        queue.remove(entry)
+        self._waiting -= 1
+        if not queue:
+            del users[user]
+
+    def _dispatch(self):
+        while self._running < self.max_concurrency and self._waiting > 0:
+            for priority in sorted(self._queues):
+                users = self._queues[priority]
+                if users:
+                    break
+            else:
+                return
+            # 取轮转顺序中的第一个用户，出队后把该用户移到末尾
+            user, queue = next(iter(users.items()))
+            future, _ = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if future.done():
+                continue
+            self._running += 1
+            self._stats["admitted"] += 1
+            future.set_result(None)
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats.update({
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_time": {},
+        })
+        for priority, name in PRIORITY_NAMES.items():
+            waits = sorted(self._wait_times[priority])
+            if not waits:
+                continue
+            stats["queue_time"][name] = {
+                "samples": len(waits),
+                "waiting": sum(len(queue) for queue in self._queues[priority].values()),
+                "avg_ms": sum(waits) / len(waits) * 1000,
+                "p95_ms": waits[min(int(len(waits) * 0.95), len(waits) - 1)] * 1000,
+                "max_ms": waits[-1] * 1000,
+            }
+        return stats
@@ -10,6 +10,9 @@ class Message(BaseModel):
 
 class Conversation(BaseModel):
     messages: List[Message]
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    cache: bool = False  # temperature为0时自动使用缓存，也可显式开启
 
 
 class ConversationResponseUsage(BaseModel):
@@ -36,6 +39,8 @@ class ConversationResponse(BaseModel):
 class PassageIdea(BaseModel):
     passage_type: str
     passage_tag: List[str]
+    temperature: Optional[float] = None
+    cache: bool = False
 
 class PassageResponse(BaseModel):
     passage_type: str
@@ -54,7 +59,21 @@ class LatexOutputRequest(BaseModel):
     template_type: str = "article"  # 默认使用 article 模板
     paper_title: str = "论文标题"
     author_name: str = "作者姓名"
+    temperature: Optional[float] = None
+    cache: bool = False
+    polish: bool = False  # 是否让大模型润色段落正文，默认直接用模板生成
+    document_id: str = ""  # 同一篇论文多次编译时复用构建目录
 
 class LatexOutputResponse(BaseModel):
     tex_content: str
     pdf_url: str
+    job_id: str = ""
+
+class LatexJobStatus(BaseModel):
+    job_id: str
+    status: str
+    error: str
+    queue_seconds: float
+    compile_seconds: float
+    pass_seconds: List[float] = []
+    used_format: bool = False
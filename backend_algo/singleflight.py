@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+import json
+
+
+def _normalize(value):
+    """规范化请求体：去掉字符串首尾空白，丢弃空字符串列表项"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, list):
+        items = [_normalize(item) for item in value]
+        return [item for item in items if item != ""]
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    return value
+
+
+def request_key(name, request):
+    """用接口名和规范化后的请求体（pydantic模型）计算合并键"""
+    body = json.dumps(_normalize(request.model_dump()), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{name}:{body}".encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次，所有调用方共享同一结果（或异常）"""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {"calls": 0, "executions": 0, "shared": 0}
+
+    async def do(self, key, func):
+        self._stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            self._stats["executions"] += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._stats["shared"] += 1
+        # shield：某个调用方断开连接时不取消其他调用方共享的计算
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._calls)
+        return stats
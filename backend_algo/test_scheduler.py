@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import scheduler
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _yield():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        llm = scheduler.LLMScheduler(max_concurrency=1, max_queue_depth=4)
+        await llm.acquire("a")
+        waiter = asyncio.create_task(llm.acquire("b"))
+        await _yield()
+        assert llm.get_stats()["waiting"] == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert llm.get_stats()["waiting"] == 0
+        assert llm.get_stats()["cancelled"] == 1
+
+        llm.release()
+        assert llm.get_stats()["running"] == 0
+        await asyncio.wait_for(llm.acquire("c"), timeout=1)
+        assert llm.get_stats()["running"] == 1
+
+    run(scenario())
+
+
+def test_slot_returned_when_waiter_cancelled_after_dispatch():
+    async def scenario():
+        llm = scheduler.LLMScheduler(max_concurrency=1, max_queue_depth=4)
+        await llm.acquire("a")
+        waiter = asyncio.create_task(llm.acquire("b"))
+        await _yield()
+
+        # 名额已分配给排队者，但排队者在恢复运行前被取消
+        llm.release()
+        assert llm.get_stats()["running"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert llm.get_stats()["running"] == 0
+        assert llm.get_stats()["waiting"] == 0
+
+    run(scenario())
+
+
+def test_slot_released_on_error():
+    async def scenario():
+        llm = scheduler.LLMScheduler(max_concurrency=1, max_queue_depth=4)
+        with pytest.raises(RuntimeError):
+            async with llm.slot("a"):
+                raise RuntimeError("upstream failed")
+        assert llm.get_stats()["running"] == 0
+
+    run(scenario())
+
+
+def test_stream_never_started_holds_no_slot():
+    async def scenario():
+        llm = scheduler.LLMScheduler(max_concurrency=1, max_queue_depth=4)
+
+        async def stream():
+            async with llm.slot("a", scheduler.PRIORITY_INTERACTIVE):
+                yield b"data"
+
+        # 与 /chat/stream/ 相同：客户端在开始迭代前断开时生成器从未运行
+        generator = stream()
+        await generator.aclose()
+        assert llm.get_stats()["running"] == 0
+
+        # 迭代中途断开时生成器关闭，名额归还
+        generator = stream()
+        assert await generator.__anext__() == b"data"
+        assert llm.get_stats()["running"] == 1
+        await generator.aclose()
+        assert llm.get_stats()["running"] == 0
+
+    run(scenario())
+
+
+def test_queue_full_rejected():
+    async def scenario():
+        llm = scheduler.LLMScheduler(max_concurrency=1, max_queue_depth=1)
+        await llm.acquire("a")
+        waiter = asyncio.create_task(llm.acquire("b"))
+        await _yield()
+        with pytest.raises(scheduler.QueueFullError):
+            llm.ensure_capacity()
+        with pytest.raises(scheduler.QueueFullError):
+            await llm.acquire("c")
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    run(scenario())
@@ -0,0 +1,173 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+
+class NoHealthyUpstreamError(Exception):
+    """所有上游节点都不可用"""
+
+
+def urls_from_env(name, default):
+    """从环境变量读取逗号分隔的上游地址列表"""
+    value = os.getenv(name, default)
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+class Upstream:
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0  # 正在处理的请求数
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # 熔断截止时间
+        self.half_open = False  # 熔断结束后只放行一个试探请求
+        self.requests = 0
+        self.failures = 0
+
+
+class UpstreamPool:
+    """客户端负载均衡：最少未完成请求路由、被动健康检查与熔断、幂等请求换节点重试"""
+
+    def __init__(self, urls, name="upstream", failure_threshold=3, cooldown=30.0, session=None):
+        if not urls:
+            raise ValueError(f"{name} 没有配置上游地址")
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.session = session or requests.Session()
+        self._upstreams = [Upstream(url) for url in urls]
+        self._lock = threading.Lock()
+
+    def _acquire(self, exclude):
+        """选择未完成请求最少的可用节点，并计入其未完成请求数"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for upstream in self._upstreams:
+                if upstream in exclude:
+                    continue
+                if upstream.open_until > now:
+                    continue
+                if upstream.half_open and upstream.outstanding > 0:
+                    continue
+                candidates.append(upstream)
+            if not candidates:
+                return None
+            least = min(upstream.outstanding for upstream in candidates)
+            upstream = random.choice([candidate for candidate in candidates if candidate.outstanding == least])
+            upstream.outstanding += 1
+            upstream.requests += 1
+            return upstream
+
+    def _release(self, upstream, success):
+        with self._lock:
+            upstream.outstanding -= 1
+            if success:
+                upstream.consecutive_failures = 0
+                upstream.half_open = False
+                return
+            upstream.failures += 1
+            upstream.consecutive_failures += 1
+            if upstream.half_open or upstream.consecutive_failures >= self.failure_threshold:
+                # 熔断：冷却期内不再路由到该节点，冷却结束后进入半开状态
+                upstream.open_until = time.monotonic() + self.cooldown
+                upstream.half_open = True
+                print(f"{self.name} 节点 {upstream.url} 熔断 {self.cooldown:.0f} 秒")
+
+    def request(self, method, path, idempotent=True, max_attempts=None, **kwargs):
+        """发送请求；幂等请求遇到连接错误、超时或5xx时换一个节点重试"""
+        attempts = max_attempts or (len(self._upstreams) if idempotent else 1)
+        tried = set()
+        last_error = None
+        for _ in range(attempts):
+            upstream = self._acquire(tried)
+            if upstream is None:
+                break
+            tried.add(upstream)
+            try:
+                response = self.session.request(method, f"{upstream.url}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._release(upstream, success=False)
+                last_error = e
+                if not idempotent:
+                    raise
+                continue
+            if response.status_code >= 500:
+                self._release(upstream, success=False)
+                last_error = requests.HTTPError(f"{upstream.url} 返回 {response.status_code}", response=response)
+                if idempotent and len(tried) < attempts:
+                    continue
+                return response
+            self._release(upstream, success=True)
+            return response
+        if last_error is not None:
+            raise last_error
+        raise NoHealthyUpstreamError(f"{self.name} 没有可用的上游节点")
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    @contextmanager
+    def stream(self, method, path, **kwargs):
+        """流式请求：仅在建立连接阶段失败时换节点重试，响应关闭后才释放节点"""
+        tried = set()
+        last_error = None
+        while True:
+            upstream = self._acquire(tried)
+            if upstream is None:
+                if last_error is not None:
+                    raise last_error
+                raise NoHealthyUpstreamError(f"{self.name} 没有可用的上游节点")
+            tried.add(upstream)
+            try:
+                response = self.session.request(method, f"{upstream.url}{path}", stream=True, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._release(upstream, success=False)
+                last_error = e
+                continue
+            break
+        success = response.status_code < 500
+        try:
+            with response:
+                yield response
+        except (requests.ConnectionError, requests.Timeout):
+            success = False
+            raise
+        finally:
+            self._release(upstream, success=success)
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": upstream.url,
+                    "outstanding": upstream.outstanding,
+                    "requests": upstream.requests,
+                    "failures": upstream.failures,
+                    "circuit_open": upstream.open_until > now,
+                }
+                for upstream in self._upstreams
+            ]
+
+
+class BalancedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """通过上游节点池调用 OpenAI 兼容的 /embeddings 接口的 Chroma embedding 函数"""
+
+    def __init__(self, pool, model_name, timeout=60):
+        self.pool = pool
+        self.model_name = model_name
+        self.timeout = timeout
+
+    def __call__(self, input: Documents) -> Embeddings:
+        response = self.pool.post("/embeddings", json={
+            "model": self.model_name,
+            "input": list(input),
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
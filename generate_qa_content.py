@@ -71,7 +71,8 @@ def generate_passage_with_llm(passage_type: str, keywords: List[str]) -> tuple[s
         # 构建请求数据，匹配PassageIdea模式
         request_data = {
             "passage_type": passage_type,
-            "passage_tag": keywords
+            "passage_tag": keywords,
+            "cache": True  # 重复评测时复用缓存的大模型结果
         }
         
         # 发送请求到新的writing接口